@@ -0,0 +1,266 @@
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, Optional
+
+from jobs import JobStatus
+from notebooks.journal import AnalysisJournal
+
+UNKNOWN_GAME = 'unknown'
+
+
+def normalize_label(text) -> str:
+    """Lower-cased with whitespace collapsed, so the same pattern worded alike is counted once."""
+    return ' '.join(str(text).lower().split())
+
+
+def contribution(analysis: Dict, seconds: float = 0.0) -> Dict:
+    """What one analysis adds to its user's counters for its game.
+
+    `seconds` is the video length, 0 when unknown; such videos are left out
+    of mistakes per minute.
+    """
+    patterns = {}
+    for error in analysis.get('repeated_errors') or []:
+        if isinstance(error, dict) and error.get('pattern'):
+            label = normalize_label(error['pattern'])
+            patterns[label] = patterns.get(label, 0) + len(error.get('occurrences') or [])
+    return {
+        'mistakes': len(analysis.get('mistakes') or []),
+        'missed_opportunities': len(analysis.get('missed_opportunities') or []),
+        'seconds': seconds,
+        'repeated_errors': patterns,  # pattern -> occurrences in this video
+        'focus_areas': sorted({normalize_label(area) for area in analysis.get('key_focus_areas') or [] if area}),
+    }
+
+
+def _bump(counter: Dict[str, int], key: str, amount: int):
+    value = counter.get(key, 0) + amount
+    if value:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+
+class Tally:
+    """Counters summed over a set of videos. Videos are added and subtracted by their contribution."""
+
+    __slots__ = ('videos', 'mistakes', 'missed_opportunities', 'seconds', 'timed_mistakes',
+                 'pattern_videos', 'pattern_occurrences', 'focus_areas')
+
+    def __init__(self):
+        self.videos = 0
+        self.mistakes = 0
+        self.missed_opportunities = 0
+        self.seconds = 0.0
+        self.timed_mistakes = 0  # mistakes in videos whose length is known
+        self.pattern_videos: Dict[str, int] = {}
+        self.pattern_occurrences: Dict[str, int] = {}
+        self.focus_areas: Dict[str, int] = {}  # area -> videos
+
+    def apply(self, item: Dict, sign: int = 1):
+        self.videos += sign
+        self.mistakes += sign * item['mistakes']
+        self.missed_opportunities += sign * item['missed_opportunities']
+        if item['seconds'] > 0:
+            self.seconds += sign * item['seconds']
+            self.timed_mistakes += sign * item['mistakes']
+        for pattern, occurrences in item['repeated_errors'].items():
+            _bump(self.pattern_videos, pattern, sign)
+            _bump(self.pattern_occurrences, pattern, sign * occurrences)
+        for area in item['focus_areas']:
+            _bump(self.focus_areas, area, sign)
+
+    def summary(self, top: int = 10) -> Dict:
+        def ranked(counter):
+            return sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+        minutes = self.seconds / 60
+        return {
+            'videos': self.videos,
+            'mistakes': self.mistakes,
+            'missed_opportunities': self.missed_opportunities,
+            'minutes': round(minutes, 1),
+            'mistakes_per_minute': round(self.timed_mistakes / minutes, 3) if minutes else None,
+            'repeated_errors': [{'pattern': pattern, 'videos': videos,
+                                 'occurrences': self.pattern_occurrences.get(pattern, 0)}
+                                for pattern, videos in ranked(self.pattern_videos)],
+            'focus_areas': [{'area': area, 'videos': videos} for area, videos in ranked(self.focus_areas)],
+        }
+
+
+class GameStats:
+    """One user's counters for one game: over all their videos and over the most recent `window`."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.videos: 'OrderedDict[str, Dict]' = OrderedDict()  # filename -> contribution, oldest first
+        self.recent_files = deque()  # the last `window` filenames of `videos`
+        self.all_time = Tally()
+        self.recent = Tally()
+
+    def add(self, filename: str, item: Dict):
+        self.remove(filename)
+        self.videos[filename] = item
+        self.all_time.apply(item)
+        self.recent_files.append(filename)
+        self.recent.apply(item)
+        if len(self.recent_files) > self.window:
+            self.recent.apply(self.videos[self.recent_files.popleft()], -1)
+
+    def remove(self, filename: str):
+        item = self.videos.pop(filename, None)
+        if item is None:
+            return
+        self.all_time.apply(item, -1)
+        if filename in self.recent_files:
+            self.recent_files.remove(filename)
+            self.recent.apply(item, -1)
+            # Move the newest video outside the window into it
+            if len(self.videos) > len(self.recent_files):
+                newer = set(self.recent_files)
+                for candidate in reversed(self.videos):
+                    if candidate not in newer:
+                        self.recent_files.appendleft(candidate)
+                        self.recent.apply(self.videos[candidate])
+                        break
+
+
+class StatsAggregator:
+    """Per-user, per-game trends across analyses, kept up to date as analyses complete.
+
+    Each completed analysis is reduced once to a small contribution (mistake
+    and missed opportunity counts, video length, repeated-error patterns and
+    key focus areas) that is added to running counters, both over all of the
+    user's videos of that game and over their last `window`. Reading stats
+    never touches the analyses themselves. Re-analyzed videos replace their
+    earlier contribution.
+
+    Each change is appended to an AnalysisJournal next to `path` (one line
+    per video, None for a removed one) and compacted into `path` once the
+    journal outgrows it, so counters survive restarts without rewriting
+    every user's data on each completion. `rebuild` recomputes them from
+    stored records. `duration(filename)` gives a video's length in
+    seconds, 0 when it could not be read.
+    """
+
+    def __init__(self, path: str, window: int = 50, duration: Optional[Callable[[str], float]] = None):
+        self.path = path
+        self.window = window
+        self.duration = duration
+        self.journal = AnalysisJournal(path)
+        self._users: Dict[Optional[str], Dict[str, GameStats]] = {}
+        self._owners: Dict[str, tuple] = {}  # filename -> (user_id, game)
+        self._seq = 0  # completion order, so the recent windows survive a reload
+        self._lock = threading.Lock()
+        self.loaded = self._load()
+
+    def update(self, old_status: Optional[str], record: Dict):
+        """Store listener: count completed analyses and drop videos that leave the completed state."""
+        if record['status'] == JobStatus.COMPLETED and record['analysis']:
+            item = contribution(record['analysis'], self._seconds(record['filename']))
+            with self._lock:
+                entry = self._add(record['user_id'], record['filename'], record['analysis'].get('game'), item)
+                self._persist({record['filename']: entry})
+        elif record['filename'] in self._owners:
+            with self._lock:
+                if record['filename'] in self._owners:
+                    self._remove(record['filename'])
+                    self._persist({record['filename']: None})
+
+    def rebuild(self, records: Iterable[Dict], user_id: Optional[str] = None) -> int:
+        """Recompute counters from completed `records`: everyone's, or only `user_id`'s. Returns the video count."""
+        records = sorted((record for record in records
+                          if record['status'] == JobStatus.COMPLETED and record['analysis']
+                          and (user_id is None or record['user_id'] == user_id)),
+                         key=lambda record: (record['updated_at'], record['filename']))
+        items = [(record, contribution(record['analysis'], self._seconds(record['filename'])))
+                 for record in records]
+        with self._lock:
+            dropped = [name for name, owner in self._owners.items() if user_id is None or owner[0] == user_id]
+            for filename in dropped:
+                self._remove(filename)
+            changes = dict.fromkeys(dropped)
+            for record, item in items:
+                changes[record['filename']] = self._add(record['user_id'], record['filename'],
+                                                        record['analysis'].get('game'), item)
+            if changes:
+                self.journal.append(changes)
+                self.journal.compact(self._snapshot())
+        logging.info(f"Rebuilt video stats from {len(items)} analyses")
+        return len(items)
+
+    def stats(self, user_id: Optional[str], game: Optional[str] = None, top: int = 10) -> Dict:
+        """Summaries for each of `user_id`'s games (or just `game`), over the recent window and all time."""
+        with self._lock:
+            games = self._users.get(user_id, {})
+            if game is not None:
+                games = {game: games[game]} if game in games else {}
+            return {
+                'window': self.window,
+                'games': {name: {'recent': stats.recent.summary(top), 'all_time': stats.all_time.summary(top)}
+                          for name, stats in games.items()},
+            }
+
+    def _seconds(self, filename: str) -> float:
+        if self.duration is None:
+            return 0.0
+        try:
+            return float(self.duration(filename) or 0.0)
+        except Exception as e:
+            logging.warning(f"Could not read the length of {filename}: {e}")
+            return 0.0
+
+    def _add(self, user_id: Optional[str], filename: str, game: Optional[str], item: Dict,
+             seq: Optional[int] = None) -> Dict:
+        """Count `item` and return its journal entry. Called with the lock held."""
+        game = game or UNKNOWN_GAME
+        seq = self._seq if seq is None else seq
+        self._seq = max(self._seq, seq + 1)
+        owner = self._owners.get(filename)
+        if owner is not None and owner != (user_id, game):
+            self._remove(filename)
+        games = self._users.setdefault(user_id, {})
+        if game not in games:
+            games[game] = GameStats(self.window)
+        games[game].add(filename, item)
+        self._owners[filename] = (user_id, game)
+        return {'user_id': user_id, 'game': game, 'seq': seq, 'item': item}
+
+    def _remove(self, filename: str):
+        # Called with the lock held
+        user_id, game = self._owners.pop(filename)
+        games = self._users[user_id]
+        games[game].remove(filename)
+        if not games[game].videos:
+            del games[game]
+            if not games:
+                del self._users[user_id]
+
+    def _persist(self, changes: Dict[str, Optional[Dict]]):
+        # Called with the lock held
+        if self.journal.append(changes):
+            self.journal.compact(self._snapshot())
+
+    def _snapshot(self) -> Dict[str, Dict]:
+        # Called with the lock held. Only the order within a game matters for its window
+        return {
+            filename: {'user_id': user_id, 'game': game, 'seq': seq, 'item': item}
+            for user_id, games in self._users.items() for game, stats in games.items()
+            for seq, (filename, item) in enumerate(stats.videos.items())
+        }
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path) and not os.path.exists(self.journal.journal_path):
+            return False
+        try:
+            data = self.journal.load()
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable stats file {self.path}: {e}")
+            return False
+        entries = sorted(((filename, entry) for filename, entry in data.items() if entry is not None),
+                         key=lambda pair: pair[1]['seq'])
+        for filename, entry in entries:
+            self._add(entry['user_id'], filename, entry['game'], entry['item'], entry['seq'])
+        return True
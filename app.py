@@ -1,30 +1,111 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory, session
+from flask import Flask, Response, g, request, jsonify, render_template, send_from_directory, session
 from werkzeug.utils import secure_filename
 import os
 from functools import wraps
+import hashlib
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Dict, List
-import google.generativeai as genai
 from cryptography.fernet import Fernet
 
+try:
+    import fcntl
+except ImportError:  # Windows: writes are still atomic, just not locked across processes
+    fcntl = None
+
+from jobs import JobScheduler, JobStatus, QueueFullError
+from storage import InvalidTransitionError, OwnershipError, create_store, migrate_json
+from chunked_upload import ChunkedUploadManager, UploadError
+from events import EventBroadcaster
+from aggregates import StatsAggregator
+from search_index import SearchIndex, parse_query
+from notebooks.backend import AnalysisService, PromptGenerator
+from notebooks.cache import AnalysisCache
+from notebooks.gemini_clients import GeminiClientRegistry
+from notebooks.media_info import estimate_video_seconds, probe_mp4
+from notebooks.metrics import metrics
+from notebooks.resilience import InferencePolicy, poll_delay
+from notebooks.schema import DecodeStats
+from notebooks.streaming import TIMED_SECTIONS
+from notebooks.timeline import EVENT_KINDS, AnalysisTimeline
+
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # Required for session management
 
 class AppConfig:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', '/uploads')
     JSON_FILE = os.environ.get('JSON_FILE', 'processed_videos.json')
+    STORE_BACKEND = os.environ.get('STORE_BACKEND', 'sqlite')  # 'sqlite' or 'json'
+    DATABASE = os.environ.get('DATABASE', 'analysis.db')
     ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'wmv', 'flv', 'webm'}
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max request size (single uploads and chunks)
+
+    # /videos pagination
+    VIDEOS_PAGE_SIZE = int(os.environ.get('VIDEOS_PAGE_SIZE', 50))
+    VIDEOS_MAX_PAGE_SIZE = 200
+
+    # Chunked uploads
+    CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 8 * 1024 * 1024))
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 20 * 1024 * 1024 * 1024))  # 20GB
+    UPLOAD_EXPIRY_HOURS = float(os.environ.get('UPLOAD_EXPIRY_HOURS', 24))  # idle unfinished uploads are deleted
+
+    # Background processing
+    WORKER_COUNT = int(os.environ.get('WORKER_COUNT', 2))
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+    # Shorter videos are analyzed first; each second a video waits counts as this many seconds shorter
+    SCHEDULER_AGING = float(os.environ.get('SCHEDULER_AGING', 10))
+    GAME_NAME = os.environ.get('GAME_NAME', 'EA FC 24')
+    MODEL_NAME = os.environ.get('MODEL_NAME', 'models/gemini-2.0-flash')
+    # Stream the model response and store mistakes and missed opportunities as they arrive
+    STREAM_ANALYSIS = os.environ.get('STREAM_ANALYSIS', '1') != '0'
+    # Constrain the response to the analysis schema and leave the JSON example out of the prompt
+    STRUCTURED_OUTPUT = os.environ.get('STRUCTURED_OUTPUT', '0') != '0'
+    # Retries, hedging and fallback for analysis requests
+    ANALYSIS_ATTEMPTS = int(os.environ.get('ANALYSIS_ATTEMPTS', 3))
+    ANALYSIS_TIMEOUT = int(os.environ.get('ANALYSIS_TIMEOUT', 600))  # seconds per request
+    HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 0))  # e.g. 95; 0 disables hedging
+    FALLBACK_MODEL_NAME = os.environ.get('FALLBACK_MODEL_NAME') or None
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+    CIRCUIT_RESET_TIMEOUT = int(os.environ.get('CIRCUIT_RESET_TIMEOUT', 60))  # seconds
+    # Stage timings, token usage and route latencies on /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    MAX_WAIT_TIME = 120  # seconds
+    WAIT_INTERVAL = 5    # seconds, longest gap between activation polls
+    POLL_INITIAL_INTERVAL = 1  # seconds
+
+    # One Gemini client per API key, reused across that user's requests
+    GEMINI_MAX_CLIENTS = int(os.environ.get('GEMINI_MAX_CLIENTS', 64))
+    GEMINI_CLIENT_IDLE_TIMEOUT = int(os.environ.get('GEMINI_CLIENT_IDLE_TIMEOUT', 1800))  # seconds
     
+    # Analysis cache, keyed by video content + prompt + model
+    CACHE_FILE = os.environ.get('CACHE_FILE', 'analysis_cache.json')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1000))
+
     # API key encryption
     ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY', Fernet.generate_key())
-    KEYS_FILE = 'api_keys.json'
+    KEYS_FILE = os.environ.get('KEYS_FILE', 'api_keys.json')
+    API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', 300))  # seconds
+    API_KEY_CACHE_SIZE = int(os.environ.get('API_KEY_CACHE_SIZE', 1024))
+
+    # Completed analyses kept as timestamp-sorted timelines for /analysis/<filename>/events
+    TIMELINE_CACHE_SIZE = int(os.environ.get('TIMELINE_CACHE_SIZE', 256))
+
+    # Per-user, per-game trends for /stats, updated as analyses complete
+    STATS_FILE = os.environ.get('STATS_FILE', 'video_stats.json')
+    STATS_WINDOW = int(os.environ.get('STATS_WINDOW', 50))  # most recent videos per game
+
+    # /search results per page
+    SEARCH_LIMIT = int(os.environ.get('SEARCH_LIMIT', 20))
+    SEARCH_MAX_LIMIT = 100
     
     @classmethod
     def init_app(cls):
         os.makedirs(cls.UPLOAD_FOLDER, exist_ok=True)
-        if not os.path.exists(cls.JSON_FILE):
+        if cls.STORE_BACKEND == 'json' and not os.path.exists(cls.JSON_FILE):
             with open(cls.JSON_FILE, 'w') as f:
                 json.dump({}, f)
         if not os.path.exists(cls.KEYS_FILE):
@@ -32,22 +113,63 @@ class AppConfig:
                 json.dump({}, f)
 
 class APIKeyManager:
-    def __init__(self, key_file: str, encryption_key: bytes):
+    """Encrypted per-user API keys in KEYS_FILE.
+
+    Decrypted keys are cached in memory for `cache_ttl` seconds (at most
+    `cache_size` users, least recently used first out), so authenticating a
+    request normally neither reads the file nor decrypts. Writes take an
+    exclusive lock on a sidecar lock file and replace the key file
+    atomically, so concurrent processes never lose or half-write keys. A key
+    changed by another process is picked up here once its cache entry expires.
+    """
+
+    def __init__(self, key_file: str, encryption_key: bytes, cache_ttl: float = 300, cache_size: int = 1024):
         self.key_file = key_file
         self.fernet = Fernet(encryption_key)
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # user_id -> (expires_at, api_key)
+        self._lock = threading.Lock()
     
     def save_key(self, user_id: str, api_key: str):
         encrypted_key = self.fernet.encrypt(api_key.encode())
-        keys = self._load_keys()
-        keys[user_id] = encrypted_key.decode()
-        self._save_keys(keys)
+        with self._file_lock():
+            keys = self._load_keys()
+            keys[user_id] = encrypted_key.decode()
+            self._save_keys(keys)
+        self._remember(user_id, api_key)
     
     def get_key(self, user_id: str) -> str:
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[0] > time.monotonic():
+                self._cache.move_to_end(user_id)
+                return cached[1]
         keys = self._load_keys()
         if user_id not in keys:
             return None
         encrypted_key = keys[user_id].encode()
-        return self.fernet.decrypt(encrypted_key).decode()
+        api_key = self.fernet.decrypt(encrypted_key).decode()
+        self._remember(user_id, api_key)
+        return api_key
+
+    def _remember(self, user_id: str, api_key: str):
+        with self._lock:
+            self._cache[user_id] = (time.monotonic() + self.cache_ttl, api_key)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.key_file + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
     
     def _load_keys(self) -> Dict:
         try:
@@ -57,12 +179,131 @@ class APIKeyManager:
             return {}
     
     def _save_keys(self, keys: Dict):
-        with open(self.key_file, 'w') as f:
+        tmp_path = f"{self.key_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(keys, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.key_file)
+
+class TimelineCache:
+    """AnalysisTimelines of completed videos, least recently used first out.
+
+    A timeline is built when a video's analysis is completed (through the
+    store listener `update`) or on the first query after a restart, and
+    dropped when the video changes state or is deleted. Analyses that are
+    still streaming in are indexed per request and not kept.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self._timelines = OrderedDict()  # filename -> AnalysisTimeline
+        self._lock = threading.Lock()
+
+    def get(self, record: Dict) -> AnalysisTimeline:
+        filename = record['filename']
+        if record['status'] != JobStatus.COMPLETED:
+            return AnalysisTimeline.from_analysis(record['analysis'] or {})
+        with self._lock:
+            timeline = self._timelines.get(filename)
+            if timeline is not None:
+                self._timelines.move_to_end(filename)
+                return timeline
+        return self._put(filename, record['analysis'] or {})
+
+    def update(self, old_status, record):
+        if record['status'] == JobStatus.COMPLETED and record['analysis']:
+            self._put(record['filename'], record['analysis'])
+        else:
+            self.discard(record['filename'])
+
+    def discard(self, filename: str):
+        with self._lock:
+            self._timelines.pop(filename, None)
+
+    def _put(self, filename: str, analysis: Dict) -> AnalysisTimeline:
+        timeline = AnalysisTimeline.from_analysis(analysis)
+        with self._lock:
+            self._timelines[filename] = timeline
+            self._timelines.move_to_end(filename)
+            while len(self._timelines) > self.size:
+                self._timelines.popitem(last=False)
+        return timeline
 
 app.config.from_object(AppConfig)
 AppConfig.init_app()
-key_manager = APIKeyManager(AppConfig.KEYS_FILE, AppConfig.ENCRYPTION_KEY)
+key_manager = APIKeyManager(AppConfig.KEYS_FILE, AppConfig.ENCRYPTION_KEY,
+                            cache_ttl=AppConfig.API_KEY_CACHE_TTL, cache_size=AppConfig.API_KEY_CACHE_SIZE)
+
+if AppConfig.STORE_BACKEND == 'json':
+    store = create_store('json', AppConfig.JSON_FILE)
+else:
+    store = create_store(AppConfig.STORE_BACKEND, AppConfig.DATABASE)
+    # One-shot import of the legacy JSON file into a fresh database
+    if store.is_empty() and os.path.exists(AppConfig.JSON_FILE):
+        migrate_json(AppConfig.JSON_FILE, store)
+
+broadcaster = EventBroadcaster()
+
+def publish_status(old_status, record):
+    broadcaster.publish({
+        'user_id': record['user_id'],
+        'filename': record['filename'],
+        'old_status': old_status,
+        'status': record['status'],
+        'progress': JobStatus.PROGRESS.get(record['status'], 0.0),
+        'error': record['error'],
+    })
+
+store.add_listener(publish_status)
+timelines = TimelineCache(AppConfig.TIMELINE_CACHE_SIZE)
+store.add_listener(timelines.update)
+def probed_seconds(filename: str) -> float:
+    # Only a length read from the container; a guess from the file size would skew mistakes per minute
+    info = probe_mp4(os.path.join(AppConfig.UPLOAD_FOLDER, filename))
+    return info.duration if info is not None else 0.0
+
+video_stats = StatsAggregator(AppConfig.STATS_FILE, window=AppConfig.STATS_WINDOW, duration=probed_seconds)
+if not video_stats.loaded:
+    video_stats.rebuild(store.list(status=JobStatus.COMPLETED))
+store.add_listener(video_stats.update)
+search_index = SearchIndex()
+search_index.rebuild(store.list(status=JobStatus.COMPLETED))
+store.add_listener(search_index.update)
+
+analysis_cache = AnalysisCache(AppConfig.CACHE_FILE, max_entries=AppConfig.CACHE_MAX_ENTRIES)
+decode_stats = DecodeStats()  # validation failures and retries avoided, across all jobs
+gemini_clients = GeminiClientRegistry(AppConfig.GEMINI_MAX_CLIENTS, AppConfig.GEMINI_CLIENT_IDLE_TIMEOUT)
+inference_policy = InferencePolicy(  # shared, so breakers and latency percentiles cover all jobs
+    attempts=AppConfig.ANALYSIS_ATTEMPTS,
+    timeout=AppConfig.ANALYSIS_TIMEOUT,
+    hedge_percentile=AppConfig.HEDGE_PERCENTILE or None,
+    fallback_model=AppConfig.FALLBACK_MODEL_NAME,
+    failure_threshold=AppConfig.CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=AppConfig.CIRCUIT_RESET_TIMEOUT,
+)
+if AppConfig.CHUNK_SIZE > AppConfig.MAX_CONTENT_LENGTH:
+    # Every full-size chunk would be rejected with 413
+    raise ValueError(f"CHUNK_SIZE ({AppConfig.CHUNK_SIZE}) must not be larger than "
+                     f"MAX_CONTENT_LENGTH ({AppConfig.MAX_CONTENT_LENGTH})")
+upload_manager = ChunkedUploadManager(AppConfig.UPLOAD_FOLDER, AppConfig.CHUNK_SIZE, AppConfig.MAX_UPLOAD_SIZE,
+                                      expiry_seconds=AppConfig.UPLOAD_EXPIRY_HOURS * 3600)
+metrics.enabled = AppConfig.METRICS_ENABLED
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        # The route pattern, not the path, so filenames do not become label values
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                        method=request.method, route=route, status=str(response.status_code))
+    return response
 
 def require_api_key(f):
     @wraps(f)
@@ -72,6 +313,7 @@ def require_api_key(f):
         api_key = key_manager.get_key(session['user_id'])
         if not api_key:
             return jsonify({'error': 'API key not configured'}), 401
+        g.api_key = api_key
         return f(*args, **kwargs)
     return decorated_function
 
@@ -106,10 +348,6 @@ def upload_file():
     if 'video' not in request.files:
         return jsonify({'error': 'No video file provided'}), 400
     
-    # Get API key for processing
-    api_key = key_manager.get_key(session['user_id'])
-    genai.configure(api_key=api_key)
-    
     file = request.files['video']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
@@ -118,104 +356,437 @@ def upload_file():
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
+        if scheduler.is_full():
+            return jsonify({'error': 'Processing queue is full, try again later'}), 429
+
+        previous = store.get(filename)
+        try:
+            store.update_status(filename, JobStatus.PENDING, user_id=session['user_id'])
+        except OwnershipError:
+            return jsonify({'error': 'Another user already has a video with this name'}), 409
+        except InvalidTransitionError:
+            return jsonify({'error': 'Video is already being processed'}), 409
+
+        # Saved beside the earlier upload of this name and moved over it once complete
+        part_path = file_path + '.part'
         try:
-            file.save(file_path)
-            
-            # Queue the file for analysis
-            # This would typically be handled by a background task queue (e.g., Celery)
-            # For now, we'll just mark it as pending in the JSON
-            analysis_data = load_analysis_data()
-            analysis_data[filename] = {"status": "pending"}
-            save_analysis_data(analysis_data)
-            
-            return jsonify({
-                'message': 'File uploaded successfully',
-                'filename': filename
-            }), 200
-            
+            file.save(part_path)
+            os.replace(part_path, file_path)
         except Exception as e:
             logging.error(f"Error saving file: {e}")
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            abandon_upload(filename, previous)
             return jsonify({'error': 'Error saving file'}), 500
+
+        try:
+            scheduler.submit(filename, g.api_key)
+        except QueueFullError:
+            abandon_upload(filename, previous)
+            return jsonify({'error': 'Processing queue is full, try again later'}), 429
+
+        return jsonify({
+            'message': 'File uploaded successfully',
+            'filename': filename
+        }), 200
     
     return jsonify({'error': 'Invalid file type'}), 400
 
+# Chunked uploads: POST /uploads, PUT /uploads/<id>/chunks/<n>, POST /uploads/<id>/complete
+@app.route('/uploads', methods=['POST'])
+@require_api_key
+def create_upload():
+    params = request.get_json(silent=True) or {}
+    filename = secure_filename(params.get('filename', ''))
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    record = store.get(filename)
+    if record is not None and record['user_id'] not in (None, session['user_id']):
+        # Checked again on completion; refusing here saves sending the whole file first
+        return jsonify({'error': 'Another user already has a video with this name'}), 409
+    try:
+        state = upload_manager.create(filename, int(params.get('size', 0)), session['user_id'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid file size'}), 400
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(upload_summary(state)), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@require_api_key
+def get_upload(upload_id):
+    try:
+        return jsonify(upload_summary(upload_manager.get(upload_id, session['user_id'])))
+    except UploadError as e:
+        return upload_error(e)
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@require_api_key
+def abort_upload(upload_id):
+    try:
+        upload_manager.abort(upload_id, session['user_id'])
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify({'message': 'Upload cancelled'})
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@require_api_key
+def upload_chunk(upload_id, index):
+    try:
+        state = upload_manager.write_chunk(upload_id, index, request.stream, session['user_id'])
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(upload_summary(state))
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@require_api_key
+def complete_upload(upload_id):
+    checksum = (request.get_json(silent=True) or {}).get('sha256')
+    try:
+        state = upload_manager.get(upload_id, session['user_id'])
+        if state['received'] != state['total_size']:
+            raise UploadError('Upload is incomplete', status=409, next_chunk=state['next_chunk'])
+    except UploadError as e:
+        return upload_error(e)
+
+    filename = state['filename']
+    if scheduler.is_full():
+        return jsonify({'error': 'Processing queue is full, try again later'}), 429
+    previous = store.get(filename)
+    try:
+        store.update_status(filename, JobStatus.PENDING, user_id=session['user_id'])
+    except OwnershipError:
+        return jsonify({'error': 'Another user already has a video with this name'}), 409
+    except InvalidTransitionError:
+        return jsonify({'error': 'Video is already being processed'}), 409
+
+    try:
+        state = upload_manager.finalize(upload_id, session['user_id'], checksum)
+    except UploadError as e:
+        # finalize fails before replacing the file, so an earlier upload of this name is still intact
+        abandon_upload(filename, previous)
+        return upload_error(e)
+
+    try:
+        scheduler.submit(filename, g.api_key)
+    except QueueFullError:
+        abandon_upload(filename, previous)
+        return jsonify({'error': 'Processing queue is full, try again later'}), 429
+
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'filename': filename,
+        'sha256': state['sha256'],
+    }), 200
+
 @app.route('/videos')
 def list_videos():
-    logging.debug("hello")
-    
-    analysis_data = load_analysis_data()
-    return jsonify({
-        'videos': [
-            {
-                'filename': filename,
-                'status': data.get('status', 'completed'),
-                'analysis': data,
-            }
-            for filename, data in analysis_data.items()
-        ]
-    })
+    """One page of the caller's videos as summaries, newest first.
+
+    Query parameters: cursor (from next_cursor), limit, status, game. The
+    ETag is derived from the store's per-user version, so an unchanged list
+    is answered with 304 before the store is queried.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    user_id = session['user_id']
+    limit = min(max(request.args.get('limit', AppConfig.VIDEOS_PAGE_SIZE, type=int), 1), AppConfig.VIDEOS_MAX_PAGE_SIZE)
+    params = {
+        'status': request.args.get('status'),
+        'game': request.args.get('game'),
+        'cursor': request.args.get('cursor'),
+    }
+
+    etag = f"{store.version(user_id)}-{hashlib.sha1(json.dumps([params, limit]).encode()).hexdigest()[:12]}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        videos, next_cursor = store.list_summaries(user_id, limit=limit, **params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify({'videos': videos, 'next_cursor': next_cursor})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/events')
+def stream_events():
+    """Server-Sent Events stream of status changes for the caller's videos."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    user_id = session['user_id']
+    last_id = request.headers.get('Last-Event-ID', type=int)
+
+    def stream():
+        yield f"retry: 5000\nid: {broadcaster.last_id if last_id is None else last_id}\n\n"
+        for item in broadcaster.listen(last_id):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id, event = item
+            if event.get('type') == 'resync':
+                yield f"id: {event_id}\nevent: resync\ndata: {{}}\n\n"
+            elif event['user_id'] == user_id:
+                data = {key: value for key, value in event.items() if key != 'user_id'}
+                yield f"id: {event_id}\nevent: status\ndata: {json.dumps(data)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def owned_record(filename: str):
+    """The record of `filename` if it belongs to the caller, else None: other users' videos are not found."""
+    record = store.get(filename)
+    if record is None or record['user_id'] != session['user_id']:
+        return None
+    return record
 
 @app.route('/video/<filename>')
 def serve_video(filename):
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    if owned_record(filename) is None:
+        return jsonify({'error': 'Video not found'}), 404
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 @app.route('/analysis/<filename>')
 def get_analysis(filename):
-    analysis_data = load_analysis_data()
-    if filename not in analysis_data:
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    record = owned_record(filename)
+    if record is None:
+        return jsonify({'error': 'Video not found'}), 404
+    if record['status'] != JobStatus.COMPLETED:
+        # While streaming, `analysis` holds the entries received so far
+        return jsonify({'status': record['status'], 'error': record['error'], 'analysis': record['analysis']})
+    return jsonify(record['analysis'])
+
+@app.route('/analysis/<filename>/events')
+def get_analysis_events(filename):
+    """Mistakes, missed opportunities and repeated-error occurrences in a time window, in time order.
+
+    Query parameters: from and to (seconds, both inclusive, default the whole
+    video) and kind (comma separated, any of EVENT_KINDS). Lets the player
+    fetch feedback for the part of the video being watched.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    record = owned_record(filename)
+    if record is None:
         return jsonify({'error': 'Video not found'}), 404
-    return jsonify(analysis_data[filename])
+    start = request.args.get('from', 0, type=float)
+    end = request.args.get('to', float('inf'), type=float)
+    kinds = None
+    if request.args.get('kind'):
+        kinds = [kind.strip() for kind in request.args['kind'].split(',') if kind.strip()]
+        unknown = sorted(set(kinds) - set(EVENT_KINDS))
+        if unknown:
+            return jsonify({'error': f"Unknown event kind: {', '.join(unknown)}",
+                            'kinds': list(EVENT_KINDS)}), 400
+    events = timelines.get(record).between(start, end, kinds)
+    return jsonify({
+        'filename': filename,
+        'status': record['status'],
+        'from': start,
+        'to': None if end == float('inf') else end,
+        'events': [event.to_dict() for event in events],
+    })
+
+@app.route('/stats')
+def get_stats():
+    """The caller's trends per game: counts, mistakes per minute, recurring patterns and focus areas.
+
+    Each game has `recent` (the last STATS_WINDOW completed videos) and
+    `all_time` summaries. Optional `game` and `top` (entries per ranked list)
+    query parameters.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    top = min(max(request.args.get('top', 10, type=int), 1), 100)
+    return jsonify(video_stats.stats(session['user_id'], request.args.get('game'), top))
+
+@app.route('/stats/rebuild', methods=['POST'])
+def rebuild_stats():
+    """Recompute the caller's trends from their stored analyses."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    user_id = session['user_id']
+    count = video_stats.rebuild(store.list(user_id=user_id, status=JobStatus.COMPLETED), user_id=user_id)
+    return jsonify({'videos': count, **video_stats.stats(user_id)})
+
+@app.route('/search')
+def search_analyses():
+    """The caller's videos whose analyses match `q`, best first, with the timestamps of the matching entries.
+
+    Every word and "quoted phrase" in `q` must appear in the mistakes, missed
+    opportunities or repeated errors of a video. Optional `limit`.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'No session found'}), 401
+    query = request.args.get('q', '')
+    if not parse_query(query):
+        return jsonify({'error': 'Missing search query'}), 400
+    limit = min(max(request.args.get('limit', AppConfig.SEARCH_LIMIT, type=int), 1), AppConfig.SEARCH_MAX_LIMIT)
+    return jsonify({'query': query, 'results': search_index.search(query, session['user_id'], limit)})
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of stage timings, token usage, route latencies and queue state."""
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Utility functions
 def allowed_file(filename: str) -> bool:
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in AppConfig.ALLOWED_EXTENSIONS
 
-def load_analysis_data() -> Dict:
+def upload_summary(state: Dict) -> Dict:
+    return {key: state[key] for key in ('upload_id', 'filename', 'total_size', 'chunk_size',
+                                        'total_chunks', 'next_chunk', 'received')}
+
+def upload_error(error: UploadError):
+    return jsonify({'error': str(error), **error.details}), error.status
+
+def discard_video(filename: str):
+    store.delete(filename)
+    timelines.discard(filename)
     try:
-        with open(AppConfig.JSON_FILE, 'r') as f:
-            logging.info("FFF", str(f))
-            logging.debug(AppConfig.JSON_FILE);
-            return json.load(f)
-    except FileNotFoundError:
-        logging.info(f"no file found")
-        print("file not found")
-        return {}
-
-
-# Background task simulation (in production, use Celery or similar)
-def process_video(filename: str):
+        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    except OSError:
+        pass
+
+def abandon_upload(filename: str, previous):
+    """Undo the pending record of an upload that failed: put back `previous`, or drop the new video."""
+    if previous is None:
+        discard_video(filename)
+    else:
+        store.restore(previous)
+
+def wait_for_active(client, video_file) -> bool:
+    start = time.monotonic()
+    attempt = 0
+    while time.monotonic() - start < AppConfig.MAX_WAIT_TIME:
+        state = client.get_file(video_file.name).state.name
+        if state == "ACTIVE":
+            return True
+        if state == "FAILED":
+            return False
+        time.sleep(poll_delay(attempt, AppConfig.POLL_INITIAL_INTERVAL, AppConfig.WAIT_INTERVAL))
+        attempt += 1
+    return False
+
+def process_video(filename: str, api_key: str):
     """
-    Process a video file and update its analysis data.
-    In production, this would be a Celery task.
+    Upload a video to Gemini, wait for it to become active and store the analysis.
+    Runs on a scheduler worker thread; every stage is recorded in the analysis store.
     """
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     try:
-        analysis_data = load_analysis_data()
-        if filename not in analysis_data:
+        prompt = PromptGenerator.create_game_prompt(AppConfig.GAME_NAME,
+                                                    include_example=not AppConfig.STRUCTURED_OUTPUT)
+        with metrics.span('cache_lookup'):
+            cache_key = analysis_cache.make_key(analysis_cache.content_hash(file_path), prompt, AppConfig.MODEL_NAME)
+            cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Cache hit for {filename}, skipping upload and analysis")
+            store.update_status(filename, JobStatus.COMPLETED, analysis=cached)
             return
-        
-        # Initialize the video manager and analysis service
-        # (Using the classes from our previous implementation)
-        video_file = upload_to_gemini(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        if not video_file:
-            analysis_data[filename] = {"status": "failed", "error": "Upload to Gemini failed"}
-            save_analysis_data(analysis_data)
+
+        client = gemini_clients.get(api_key)
+        store.update_status(filename, JobStatus.UPLOADING)
+        with metrics.span('upload'):
+            video_file = client.upload_file(path=file_path)
+
+        store.update_status(filename, JobStatus.ACTIVATING)
+        with metrics.span('activate'):
+            active = wait_for_active(client, video_file)
+        if not active:
+            store.update_status(filename, JobStatus.FAILED,
+                                error=f"File did not become ACTIVE within {AppConfig.MAX_WAIT_TIME}s")
             return
-        
-        # Perform analysis
-        prompt = create_game_prompt("EA FC 24")  # You might want to make this configurable
-        response = analyze_video(video_file, prompt)
-        
-        # Update analysis data
-        analysis_data[filename] = {
-            "status": "completed",
-            "analysis": extract_json(response)
-        }
-        save_analysis_data(analysis_data)
-        
+
+        store.update_status(filename, JobStatus.ANALYZING)
+        analysis_service = AnalysisService(AppConfig.MODEL_NAME, client=client,
+                                           structured=AppConfig.STRUCTURED_OUTPUT, stats=decode_stats,
+                                           policy=inference_policy)
+        if AppConfig.STREAM_ANALYSIS:
+            partial = {section: [] for section in TIMED_SECTIONS}
+
+            def store_partial(section, entry):
+                partial[section].append(entry)
+                store.update_status(filename, JobStatus.ANALYZING,
+                                    analysis={key: list(entries) for key, entries in partial.items()})
+
+            analysis = analysis_service.analyze_video_stream(video_file, prompt, on_entry=store_partial)
+        else:
+            response = analysis_service.analyze_video(video_file, prompt)
+            analysis = analysis_service.decode(response)
+
+        with metrics.span('persist'):
+            store.update_status(filename, JobStatus.COMPLETED, analysis=analysis)
+            analysis_cache.put(cache_key, analysis)
+            analysis_cache.save()
+
     except Exception as e:
         logging.error(f"Error processing video {filename}: {e}")
-        analysis_data[filename] = {"status": "failed", "error": str(e)}
-        save_analysis_data(analysis_data)
+        store.update_status(filename, JobStatus.FAILED, error=str(e))
+
+def job_cost(filename: str, api_key: str) -> float:
+    return estimate_video_seconds(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+scheduler = JobScheduler(process_video, workers=AppConfig.WORKER_COUNT, max_queue=AppConfig.JOB_QUEUE_SIZE,
+                         cost=job_cost, aging=AppConfig.SCHEDULER_AGING)
+
+UNFINISHED_STATUSES = (JobStatus.PENDING, JobStatus.UPLOADING, JobStatus.ACTIVATING, JobStatus.ANALYZING)
+
+def recover_jobs():
+    """Queue again the videos whose jobs were lost in a restart, or mark them failed.
+
+    Jobs only live in the scheduler's memory, so without this such videos
+    would keep their last status and every new upload of them would be
+    refused. A video is queued again when its file is still in
+    UPLOAD_FOLDER and its owner's API key can be read; it starts over from
+    the beginning.
+    """
+    requeued = failed = 0
+    for status in UNFINISHED_STATUSES:
+        for record in store.list(status=status):
+            filename = record['filename']
+            try:
+                api_key = key_manager.get_key(record['user_id']) if record['user_id'] else None
+            except Exception as e:  # e.g. a different ENCRYPTION_KEY than before the restart
+                logging.warning(f"Could not read the API key for {filename}: {e}")
+                api_key = None
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            if api_key and os.path.exists(file_path) and not scheduler.is_full():
+                if status != JobStatus.PENDING:
+                    # Stages only move forward, so go back to pending by way of failed
+                    store.update_status(filename, JobStatus.FAILED, error='Interrupted by a server restart')
+                    store.update_status(filename, JobStatus.PENDING, user_id=record['user_id'])
+                scheduler.submit(filename, api_key)
+                requeued += 1
+            else:
+                store.update_status(filename, JobStatus.FAILED,
+                                    error='The server restarted before the analysis finished; upload the video again')
+                failed += 1
+    if requeued or failed:
+        logging.info(f"Recovered unfinished jobs after a restart: {requeued} queued again, {failed} failed")
+
+recover_jobs()
+
+metrics.gauge('analysis_jobs', 'Analysis job scheduler state', scheduler.stats)
+metrics.gauge('analysis_cache', 'Analysis cache state', analysis_cache.stats)
+metrics.gauge('response_decoding', 'Model responses decoded and repaired',
+              lambda: {'responses': decode_stats.responses, 'validation_failures': decode_stats.validation_failures,
+                       'retries_avoided': decode_stats.retries_avoided})
+metrics.gauge('inference', 'Hedged requests, fallbacks and open circuit breakers',
+              lambda: {key: len(value) if isinstance(value, list) else value
+                       for key, value in inference_policy.stats().items()})
 
 # Routes
 @app.route('/')
@@ -0,0 +1,195 @@
+"""A local stand-in for the parts of google.generativeai this project calls.
+
+`FakeGenAI` has the same functions as the `genai` module and GeminiClient
+(upload_file, get_file, list_files, delete_file, GenerativeModel), so it can
+be passed anywhere a `client` is accepted. Latencies are drawn from
+configurable distributions, a share of requests fail with retryable
+errors, and responses are valid analyses of a chosen size.
+"""
+import datetime
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+try:
+    from google.api_core.exceptions import ServiceUnavailable
+except ImportError:
+    ServiceUnavailable = None
+
+
+@dataclass
+class Latency:
+    """Log-normal latency in seconds with the given median and 99th percentile (constant if they are equal)."""
+    median: float = 0.0
+    p99: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        if self.p99 <= self.median:
+            return self.median
+        sigma = math.log(self.p99 / self.median) / 2.326  # z-score of the 99th percentile
+        return rng.lognormvariate(math.log(self.median), sigma)
+
+
+@dataclass
+class FakeProfile:
+    upload: Latency = field(default_factory=lambda: Latency(0.05, 0.2))
+    activation: Latency = field(default_factory=lambda: Latency(0.2, 1.0))  # until get_file reports ACTIVE
+    get_file: Latency = field(default_factory=lambda: Latency(0.005, 0.02))
+    generate: Latency = field(default_factory=lambda: Latency(0.5, 2.0))
+    upload_error_rate: float = 0.0
+    generate_error_rate: float = 0.0
+    mistakes: int = 5  # entries per response section, which sets the response size
+    stream_chunk_chars: int = 200
+    seed: Optional[int] = None
+
+
+def _unavailable(message: str) -> Exception:
+    return ServiceUnavailable(message) if ServiceUnavailable is not None else ConnectionError(message)
+
+
+def fake_analysis(game: str, mistakes: int) -> Dict:
+    def timestamp(i):
+        return f"00:{i // 60:02d}:{i % 60:02d}"
+
+    return {
+        "game": game,
+        "key_focus_areas": ["Defensive positioning", "Passing decisions"],
+        "mistakes": [{
+            "timestamp": timestamp(10 * i),
+            "description": f"Mistake {i}: lost possession under light pressure in midfield.",
+            "why_incorrect": "The pass was telegraphed and the receiver was marked.",
+            "better_alternative": "Turn away from pressure and switch play to the open flank.",
+            "expected_benefit": "Keeps possession and stretches the defence.",
+        } for i in range(mistakes)],
+        "repeated_errors": [{
+            "pattern": "Sprinting with the ball into crowded areas",
+            "occurrences": [timestamp(10 * i + 5) for i in range(mistakes)],
+            "fix": "Slow down and look for the pass.",
+        }],
+        "missed_opportunities": [{
+            "timestamp": timestamp(10 * i + 7),
+            "missed_action": "Through ball to the striker's run.",
+            "expected_outcome": "One-on-one with the goalkeeper.",
+        } for i in range(mistakes)],
+    }
+
+
+class FakeFile:
+    def __init__(self, name: str, display_name: str, mime_type: str, active_at: float):
+        self.name = name
+        self.display_name = display_name
+        self.mime_type = mime_type
+        self.uri = f"https://fake.invalid/v1beta/{name}"
+        self.expiration_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48)
+        self.active_at = active_at
+
+    @property
+    def state(self):
+        return SimpleNamespace(name="ACTIVE" if time.monotonic() >= self.active_at else "PROCESSING")
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeStream:
+    def __init__(self, chunks: List[str], usage):
+        self._chunks = chunks
+        self.usage_metadata = usage
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield SimpleNamespace(text=chunk)
+
+
+class FakeModel:
+    def __init__(self, backend: "FakeGenAI", model_name: str):
+        self.backend = backend
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, request_options=None):
+        backend = self.backend
+        backend._sleep(backend.profile.generate)
+        backend._count("generate_content")
+        if backend._fails(backend.profile.generate_error_rate):
+            raise _unavailable("fake backend: model overloaded")
+        text = backend.response_text
+        usage = SimpleNamespace(prompt_token_count=25_000, candidates_token_count=len(text) // 4,
+                                total_token_count=25_000 + len(text) // 4)
+        if not stream:
+            return FakeResponse(text, usage)
+        size = backend.profile.stream_chunk_chars
+        return FakeStream([text[i:i + size] for i in range(0, len(text), size)], usage)
+
+
+class FakeGenAI:
+    """In-memory Gemini files and models. `calls` counts requests per function."""
+
+    def __init__(self, profile: Optional[FakeProfile] = None, game: str = "EA FC 24"):
+        self.profile = profile or FakeProfile()
+        self.response_text = json.dumps(fake_analysis(game, self.profile.mistakes))
+        self.calls: Dict[str, int] = {}
+        self._files: Dict[str, FakeFile] = {}
+        self._ids = itertools.count(1)
+        self._rng = random.Random(self.profile.seed)
+        self._lock = threading.Lock()
+
+    def _sample(self, latency: Latency) -> float:
+        with self._lock:
+            return latency.sample(self._rng)
+
+    def _sleep(self, latency: Latency):
+        delay = self._sample(latency)
+        if delay:
+            time.sleep(delay)
+
+    def _fails(self, rate: float) -> bool:
+        with self._lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def upload_file(self, path, mime_type: Optional[str] = None, display_name: Optional[str] = None) -> FakeFile:
+        self._sleep(self.profile.upload)
+        self._count("upload_file")
+        if self._fails(self.profile.upload_error_rate):
+            raise _unavailable("fake backend: upload failed")
+        name = f"files/fake-{next(self._ids)}"
+        video_file = FakeFile(name, display_name or os.path.basename(path), mime_type or "video/mp4",
+                              time.monotonic() + self._sample(self.profile.activation))
+        with self._lock:
+            self._files[name] = video_file
+        return video_file
+
+    def get_file(self, name: str) -> FakeFile:
+        self._sleep(self.profile.get_file)
+        self._count("get_file")
+        with self._lock:
+            return self._files[name if "/" in name else f"files/{name}"]
+
+    def list_files(self, page_size: int = 100):
+        self._count("list_files")
+        with self._lock:
+            files = list(self._files.values())
+        return iter(files)
+
+    def delete_file(self, name: str):
+        self._count("delete_file")
+        with self._lock:
+            self._files.pop(name if "/" in name else f"files/{name}", None)
+
+    def GenerativeModel(self, model_name: str) -> FakeModel:
+        return FakeModel(self, model_name)
@@ -0,0 +1,308 @@
+"""End-to-end benchmarks against the fake Gemini backend in fake_genai.py.
+
+Run from the repository root:
+
+    python -m benchmarks.run --output bench_results.json
+    python -m benchmarks.run --scenarios storage --entries 20000 --compare bench_results.json
+
+Scenarios:
+  process_videos  videos/minute through notebooks.backend.process_videos
+  flask           p50/p99 of /upload, /videos and /analysis/<filename> under concurrent clients
+  storage         cost of saving, loading and compacting processed_videos.json as it grows
+
+Results are written as JSON. With --compare, every number is printed next to
+the same number from an earlier results file.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from .fake_genai import FakeGenAI, FakeProfile, Latency, fake_analysis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentiles(samples: List[float]) -> Dict:
+    """count, p50, p99 and max, in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+
+    return {"count": len(ordered), "p50_ms": rank(50), "p99_ms": rank(99), "max_ms": ordered[-1] * 1000}
+
+
+def write_videos(directory: str, count: int, size: int) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"match_{i:05d}.mp4")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def bench_process_videos(work_dir: str, profile: FakeProfile, videos: int, video_bytes: int) -> Dict:
+    from notebooks.backend import AnalysisService, Config, VideoManager, process_videos
+    from notebooks.resilience import InferencePolicy
+
+    write_videos(os.path.join(work_dir, "videos"), videos, video_bytes)
+    config = Config(VIDEO_DIR=os.path.join(work_dir, "videos"),
+                    PROCESSED_VIDEOS_LOG=os.path.join(work_dir, "processed_videos.json"),
+                    POLL_INITIAL_INTERVAL=0.05, WAIT_INTERVAL=0.5)
+    logging.getLogger().setLevel(logging.WARNING)
+    fake = FakeGenAI(profile)
+    video_manager = VideoManager(config, client=fake)
+    analysis_service = AnalysisService(client=fake, policy=InferencePolicy(initial_backoff=0.05, max_backoff=0.5))
+
+    start = time.perf_counter()
+    process_videos(video_manager, analysis_service, "EA FC 24")
+    elapsed = time.perf_counter() - start
+    completed = len(video_manager.processed_videos)
+    return {
+        "videos": videos,
+        "completed": completed,
+        "seconds": elapsed,
+        "videos_per_minute": completed / elapsed * 60 if elapsed else 0.0,
+        "upload_workers": config.UPLOAD_WORKERS,
+        "analysis_workers": config.ANALYSIS_WORKERS,
+        "backend_calls": dict(fake.calls),
+    }
+
+
+def bench_flask(work_dir: str, profile: FakeProfile, clients: int, uploads: int, video_bytes: int) -> Dict:
+    os.environ.update({
+        "UPLOAD_FOLDER": os.path.join(work_dir, "uploads"),
+        "DATABASE": os.path.join(work_dir, "analysis.db"),
+        "JSON_FILE": os.path.join(work_dir, "processed_videos.json"),
+        "CACHE_FILE": os.path.join(work_dir, "analysis_cache.json"),
+        "KEYS_FILE": os.path.join(work_dir, "api_keys.json"),
+        "STATS_FILE": os.path.join(work_dir, "video_stats.json"),
+        "JOB_QUEUE_SIZE": str(clients * uploads + 1),
+    })
+    os.makedirs(os.environ["UPLOAD_FOLDER"], exist_ok=True)
+    import app as flask_app
+    logging.getLogger().setLevel(logging.WARNING)
+    fake = FakeGenAI(profile)
+    flask_app.gemini_clients.get = lambda api_key: fake
+
+    latencies: Dict[str, List[float]] = {"/upload": [], "/videos": [], "/analysis/<filename>": []}
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    filenames: List[str] = []
+
+    def timed(route, call):
+        start = time.perf_counter()
+        response = call()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[route].append(elapsed)
+            if response.status_code >= 400:
+                key = f"{route} {response.status_code}"
+                errors[key] = errors.get(key, 0) + 1
+        return response
+
+    def client_loop(number):
+        client = flask_app.app.test_client()
+        client.post("/api-key", json={"api_key": f"fake-key-{number}"})
+        for i in range(uploads):
+            filename = f"client{number:03d}_{i:04d}.mp4"
+            timed("/upload", lambda: client.post(
+                "/upload", data={"video": (io.BytesIO(os.urandom(video_bytes)), filename)}))
+            with lock:
+                filenames.append(filename)
+            timed("/videos", lambda: client.get("/videos"))
+            timed("/analysis/<filename>", lambda: client.get(f"/analysis/{filename}"))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    requests_done = time.perf_counter() - start
+
+    # Wait for the background workers to finish the queued analyses
+    finished = {"completed", "failed"}
+    while True:
+        records = [flask_app.store.get(filename) for filename in filenames]
+        if all(record is not None and record["status"] in finished for record in records):
+            break
+        if time.perf_counter() - start > 600:
+            break
+        time.sleep(0.05)
+    drained = time.perf_counter() - start
+    completed = sum(1 for record in records if record is not None and record["status"] == "completed")
+
+    return {
+        "clients": clients,
+        "uploads_per_client": uploads,
+        "routes": {route: percentiles(samples) for route, samples in latencies.items()},
+        "errors": errors,
+        "requests_seconds": requests_done,
+        "completed": completed,
+        "end_to_end_seconds": drained,
+        "videos_per_minute": completed / drained * 60 if drained else 0.0,
+        "backend_calls": dict(fake.calls),
+    }
+
+
+def bench_storage(work_dir: str, entries: int, step: int, mistakes: int) -> Dict:
+    from notebooks.backend import Config, VideoManager
+
+    log_path = os.path.join(work_dir, "processed_videos.json")
+    config = Config(PROCESSED_VIDEOS_LOG=log_path)
+    logging.getLogger().setLevel(logging.WARNING)
+    analysis = fake_analysis("EA FC 24", mistakes)
+    video_manager = VideoManager(config)
+    levels = []
+    saved = 0
+    while saved < entries:
+        batch = min(step, entries - saved)
+        start = time.perf_counter()
+        for i in range(saved, saved + batch):
+            video_manager.save_analysis(f"match_{i:06d}.mp4", analysis)
+        save_seconds = time.perf_counter() - start
+        saved += batch
+
+        journal_path = video_manager.journal.journal_path
+        journal_bytes = os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+        start = time.perf_counter()
+        VideoManager(config)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        json.dumps(video_manager.processed_videos, indent=4)
+        rewrite_seconds = time.perf_counter() - start
+        levels.append({
+            "entries": saved,
+            "save_us": save_seconds / batch * 1e6,
+            "load_ms": load_seconds * 1000,
+            "journal_bytes": journal_bytes,
+            "snapshot_bytes": os.path.getsize(log_path) if os.path.exists(log_path) else 0,
+            # What every save cost when the whole file was rewritten each time
+            "full_rewrite_ms": rewrite_seconds * 1000,
+        })
+
+    start = time.perf_counter()
+    video_manager.compact()
+    compact_seconds = time.perf_counter() - start
+    return {
+        "entries": entries,
+        "analysis_bytes": len(json.dumps(analysis)),
+        "levels": levels,
+        "compact_ms": compact_seconds * 1000,
+        "snapshot_bytes": os.path.getsize(log_path),
+    }
+
+
+def flatten(data, prefix: str = "") -> Dict[str, float]:
+    values = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            values.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            values.update(flatten(value, f"{prefix}[{i}]"))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        values[prefix] = data
+    return values
+
+
+def compare(results: Dict, baseline_path: str):
+    with open(baseline_path, "r") as f:
+        baseline = flatten(json.load(f)["results"])
+    for key, value in flatten(results).items():
+        before = baseline.get(key)
+        if before:
+            print(f"{key:70s} {before:14.3f} -> {value:14.3f} ({(value - before) / before:+.1%})")
+        else:
+            print(f"{key:70s} {'':14s}    {value:14.3f}")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video analysis pipeline against a fake Gemini backend.")
+    parser.add_argument("--scenarios", default="process_videos,flask,storage",
+                        help="comma separated: process_videos, flask, storage")
+    parser.add_argument("--videos", type=int, default=40, help="videos for process_videos")
+    parser.add_argument("--video-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients for flask")
+    parser.add_argument("--uploads", type=int, default=5, help="uploads per flask client")
+    parser.add_argument("--entries", type=int, default=10_000, help="processed_videos.json size for storage")
+    parser.add_argument("--step", type=int, default=1000, help="entries between storage measurements")
+    parser.add_argument("--generate-ms", type=float, default=500, help="median generate_content latency")
+    parser.add_argument("--generate-p99-ms", type=float, default=2000)
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of generate_content calls that fail")
+    parser.add_argument("--mistakes", type=int, default=5, help="entries per response section")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    profile = FakeProfile(
+        generate=Latency(args.generate_ms / 1000, args.generate_p99_ms / 1000),
+        generate_error_rate=args.error_rate,
+        mistakes=args.mistakes,
+        seed=args.seed,
+    )
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="video-analyzer-bench-")
+    try:
+        for name in scenarios:
+            scenario_dir = os.path.join(work_dir, name)
+            os.makedirs(scenario_dir)
+            print(f"Running {name}...", file=sys.stderr)
+            if name == "process_videos":
+                results[name] = bench_process_videos(scenario_dir, profile, args.videos, args.video_bytes)
+            elif name == "flask":
+                results[name] = bench_flask(scenario_dir, profile, args.clients, args.uploads, args.video_bytes)
+            elif name == "storage":
+                results[name] = bench_storage(scenario_dir, args.entries, args.step, args.mistakes)
+            else:
+                parser.error(f"unknown scenario {name}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "arguments": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+    if args.compare:
+        compare(results, args.compare)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Optional
+
+READ_SIZE = 1024 * 1024  # bytes read from the request per write
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be applied. `status` is the HTTP code to return."""
+
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class ChunkedUploadManager:
+    """Resumable uploads written straight to disk, one chunk at a time.
+
+    Chunks must arrive in order. Each one is streamed into a `.part` file in
+    READ_SIZE pieces while a running SHA-256 is updated, so memory use does
+    not depend on the chunk or file size. Upload state lives next to the
+    partial file, which lets clients resume after a dropped connection or a
+    server restart by asking for `next_chunk`.
+
+    Uploads that receive no chunk for `expiry_seconds` are abandoned and
+    deleted by `expire`, which runs at startup and at most every
+    `expiry_seconds / 4` from `create`.
+    """
+
+    ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+    def __init__(self, upload_folder: str, chunk_size: int, max_size: int, expiry_seconds: float = 24 * 3600):
+        self.upload_folder = upload_folder
+        self.state_dir = os.path.join(upload_folder, '.chunked')
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.expiry_seconds = expiry_seconds
+        self._hashers: Dict[str, object] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._next_expiry = 0.0
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.expire()
+
+    def create(self, filename: str, total_size: int, user_id: str) -> Dict:
+        if total_size <= 0 or total_size > self.max_size:
+            raise UploadError(f"File size must be between 1 and {self.max_size} bytes", status=413)
+        if time.monotonic() >= self._next_expiry:
+            self.expire()
+        upload_id = uuid.uuid4().hex
+        state = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'user_id': user_id,
+            'total_size': total_size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': -(-total_size // self.chunk_size),
+            'next_chunk': 0,
+            'received': 0,
+            'created_at': time.time(),
+        }
+        open(self._part_path(upload_id), 'wb').close()
+        self._hashers[upload_id] = hashlib.sha256()
+        self._save_state(state)
+        return state
+
+    def get(self, upload_id: str, user_id: str) -> Dict:
+        if not self.ID_PATTERN.match(upload_id):
+            raise UploadError('Upload not found', status=404)
+        try:
+            with open(self._state_path(upload_id), 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Upload not found', status=404)
+        if state['user_id'] != user_id:
+            raise UploadError('Upload not found', status=404)
+        return state
+
+    def write_chunk(self, upload_id: str, index: int, stream: BinaryIO, user_id: str) -> Dict:
+        """Append chunk `index` from `stream`. Re-sending an acknowledged chunk is a no-op."""
+        with self._lock(upload_id):
+            state = self.get(upload_id, user_id)
+            if index < state['next_chunk']:
+                return state
+            if index > state['next_chunk']:
+                raise UploadError('Chunk out of order', status=409, next_chunk=state['next_chunk'])
+
+            expected = min(state['chunk_size'], state['total_size'] - state['received'])
+            hasher = self._hasher(state)
+            pending = hasher.copy()
+            written = 0
+            part_path = self._part_path(upload_id)
+            with open(part_path, 'r+b') as f:
+                f.seek(state['received'])
+                while written <= expected:
+                    data = stream.read(READ_SIZE)
+                    if not data:
+                        break
+                    f.write(data)
+                    pending.update(data)
+                    written += len(data)
+                if written != expected:
+                    # Drop whatever arrived so the chunk can be sent again
+                    f.truncate(state['received'])
+                    raise UploadError(
+                        f"Chunk {index} must be {expected} bytes, got {written}",
+                        next_chunk=state['next_chunk'],
+                    )
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._hashers[upload_id] = pending
+            state['received'] += written
+            state['next_chunk'] += 1
+            self._save_state(state)
+            return state
+
+    def finalize(self, upload_id: str, user_id: str, sha256: Optional[str] = None) -> Dict:
+        """Move the finished file into the upload folder and return its final state."""
+        with self._lock(upload_id):
+            state = self.get(upload_id, user_id)
+            if state['received'] != state['total_size']:
+                raise UploadError('Upload is incomplete', status=409, next_chunk=state['next_chunk'])
+            digest = self._hasher(state).hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise UploadError('Checksum mismatch', status=422, sha256=digest)
+            os.replace(self._part_path(upload_id), os.path.join(self.upload_folder, state['filename']))
+            os.remove(self._state_path(upload_id))
+            self._forget(upload_id)
+            state['sha256'] = digest
+            return state
+
+    def abort(self, upload_id: str, user_id: str):
+        with self._lock(upload_id):
+            self.get(upload_id, user_id)
+            for path in (self._part_path(upload_id), self._state_path(upload_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._forget(upload_id)
+
+    def expire(self) -> int:
+        """Delete uploads that have not received a chunk for `expiry_seconds`. Returns how many."""
+        self._next_expiry = time.monotonic() + self.expiry_seconds / 4
+        cutoff = time.time() - self.expiry_seconds
+        expired = 0
+        upload_ids = {name.split('.')[0] for name in os.listdir(self.state_dir)}
+        for upload_id in filter(self.ID_PATTERN.match, upload_ids):
+            with self._lock(upload_id):
+                # Every chunk rewrites the part and state files, so their mtimes say when the upload was last used
+                paths = [self._part_path(upload_id), self._state_path(upload_id), self._state_path(upload_id) + '.tmp']
+                times = [os.path.getmtime(path) for path in paths if os.path.exists(path)]
+                if not times or max(times) > cutoff:
+                    continue
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                self._forget(upload_id)
+                expired += 1
+        if expired:
+            logging.info(f"Deleted {expired} chunked uploads idle for more than {self.expiry_seconds:.0f}s")
+        return expired
+
+    def _hasher(self, state: Dict):
+        upload_id = state['upload_id']
+        hasher = self._hashers.get(upload_id)
+        if hasher is None:
+            # Hash state is not persisted; rebuild it from the bytes already on disk
+            logging.info(f"Rebuilding checksum for upload {upload_id}")
+            hasher = hashlib.sha256()
+            remaining = state['received']
+            with open(self._part_path(upload_id), 'rb') as f:
+                while remaining:
+                    data = f.read(min(READ_SIZE, remaining))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    remaining -= len(data)
+            self._hashers[upload_id] = hasher
+        return hasher
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _forget(self, upload_id: str):
+        self._hashers.pop(upload_id, None)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+
+    def _save_state(self, state: Dict):
+        path = self._state_path(state['upload_id'])
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    def _state_path(self, upload_id: str) -> str:
+        return os.path.join(self.state_dir, f"{upload_id}.json")
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.state_dir, f"{upload_id}.part")
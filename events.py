@@ -0,0 +1,67 @@
+import itertools
+import threading
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class EventBroadcaster:
+    """Fan-out of status events to any number of listeners.
+
+    Events go into one shared ring buffer with increasing ids, so publishing
+    costs the same no matter how many clients are connected. Listeners only
+    remember the last id they have seen and read new events from the buffer
+    when woken. A listener that falls more than `history` events behind gets
+    a single resync event instead of the events it missed, and so does one
+    resuming from an id this broadcaster has not issued yet (ids start
+    again at 1 after a server restart).
+    """
+
+    def __init__(self, history: int = 1000):
+        self._events = deque(maxlen=history)
+        self._next_id = 1
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self) -> int:
+        with self._cond:
+            return self._next_id - 1
+
+    def publish(self, event: Dict) -> int:
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, event))
+            self._cond.notify_all()
+        return event_id
+
+    def listen(self, last_id: Optional[int] = None,
+               heartbeat: float = 15.0) -> Iterator[Optional[Tuple[int, Dict]]]:
+        """Yield (id, event) for events after `last_id` (or after now).
+
+        Yields None when nothing happened for `heartbeat` seconds, so callers
+        can send keep-alives and notice disconnected clients.
+        """
+        cursor = self.last_id if last_id is None else last_id
+        while True:
+            with self._cond:
+                if cursor == self._next_id - 1:
+                    self._cond.wait(heartbeat)
+                events = self._since(cursor)
+            if not events:
+                yield None
+                continue
+            for event_id, event in events:
+                cursor = event_id
+                yield event_id, event
+
+    def _since(self, cursor: int):
+        latest = self._next_id - 1
+        if cursor > latest:
+            # An id from before a server restart, when ids started again at 1
+            return [(latest, {'type': 'resync'})]
+        if not self._events or cursor == latest:
+            return []
+        first_id = self._events[0][0]
+        if cursor + 1 < first_id:
+            return [(first_id - 1, {'type': 'resync'})] + list(self._events)
+        return list(itertools.islice(self._events, cursor + 1 - first_id, None))
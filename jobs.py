@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class JobStatus:
+    PENDING = 'pending'
+    UPLOADING = 'uploading'
+    ACTIVATING = 'activating'
+    ANALYZING = 'analyzing'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    # Allowed moves for a video record. Pending videos complete directly on
+    # an analysis cache hit; analyzing videos are updated in place as streamed
+    # results arrive; finished videos may go back to pending when the same
+    # file is uploaded again.
+    TRANSITIONS = {
+        PENDING: {UPLOADING, COMPLETED, FAILED},
+        UPLOADING: {ACTIVATING, FAILED},
+        ACTIVATING: {ANALYZING, FAILED},
+        ANALYZING: {ANALYZING, COMPLETED, FAILED},
+        COMPLETED: {PENDING},
+        FAILED: {PENDING},
+    }
+
+    # Rough share of the work done when a video reaches each status
+    PROGRESS = {
+        PENDING: 0.0,
+        UPLOADING: 0.1,
+        ACTIVATING: 0.3,
+        ANALYZING: 0.5,
+        COMPLETED: 1.0,
+        FAILED: 1.0,
+    }
+
+    @classmethod
+    def can_transition(cls, old: Optional[str], new: str) -> bool:
+        if old is None:
+            return new == cls.PENDING
+        return new in cls.TRANSITIONS.get(old, set())
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another video."""
+
+
+class JobScheduler:
+    """Fixed-size pool of worker threads fed from a bounded priority queue.
+
+    `submit` never blocks: when the queue is full it raises QueueFullError so
+    callers can push back on the client instead of piling up work.
+
+    Without a `cost` function jobs run in submission order. With one, the
+    cheapest job runs first (shortest job first), aged by submission time:
+    a job's priority is `cost + aging * submitted_at`, so every second a job
+    waits is worth `aging` units of cost and a large job cannot be passed
+    over forever by a stream of small ones.
+    """
+
+    def __init__(self, handler: Callable, workers: int = 2, max_queue: int = 16,
+                 cost: Optional[Callable[..., float]] = None, aging: float = 1.0):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.cost = cost
+        self.aging = aging
+        self._heap = []  # (priority, seq, key, args, kwargs)
+        self._seq = itertools.count()
+        self._ready = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._queued = set()
+        self._running: Dict[str, threading.Thread] = {}
+
+    def start(self):
+        with self._ready:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"video-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, key: str, *args, **kwargs):
+        """Queue `handler(key, *args, **kwargs)`. Duplicate keys are ignored."""
+        self.start()
+        priority = self._priority(key, args, kwargs)
+        with self._ready:
+            if key in self._queued:
+                return False
+            if len(self._heap) >= self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+            heapq.heappush(self._heap, (priority, next(self._seq), key, args, kwargs))
+            self._queued.add(key)
+            self._ready.notify()
+        return True
+
+    def _priority(self, key: str, args, kwargs) -> float:
+        if self.cost is None:
+            return 0.0
+        try:
+            cost = self.cost(key, *args, **kwargs)
+        except Exception as e:
+            logging.warning(f"Could not estimate the cost of job {key}: {e}")
+            cost = 0.0
+        return cost + self.aging * time.monotonic()
+
+    def is_full(self) -> bool:
+        with self._ready:
+            return len(self._heap) >= self.max_queue
+
+    def stats(self) -> Dict:
+        with self._ready:
+            return {
+                'workers': self.workers,
+                'queued': len(self._heap),
+                'running': len(self._running),
+                'capacity': self.max_queue,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers once the jobs already queued have run."""
+        with self._ready:
+            threads, self._threads = self._threads, []
+            self._stopping = True
+            self._ready.notify_all()
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _worker(self):
+        while True:
+            with self._ready:
+                while not self._heap and not self._stopping:
+                    self._ready.wait()
+                if not self._heap:
+                    return
+                _, _, key, args, kwargs = heapq.heappop(self._heap)
+                self._queued.discard(key)
+                self._running[key] = threading.current_thread()
+            try:
+                self.handler(key, *args, **kwargs)
+            except Exception as e:
+                logging.error(f"Job {key} failed: {e}")
+            finally:
+                with self._ready:
+                    self._running.pop(key, None)
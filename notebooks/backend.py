@@ -8,8 +8,34 @@ class Config:
     VIDEO_DIR: str = "/content/videos"
     PROCESSED_VIDEOS_LOG: str = "processed_videos.json"
     MAX_WAIT_TIME: int = 120  # seconds
-    WAIT_INTERVAL: int = 5    # seconds
+    WAIT_INTERVAL: int = 5    # seconds, longest gap between activation polls
+    POLL_INITIAL_INTERVAL: float = 1.0  # seconds, first activation poll
+    UPLOAD_WORKERS: int = 4
+    ANALYSIS_WORKERS: int = 2
+    SEGMENT_MIN_DURATION: int = 600  # seconds; longer videos are analyzed in windows
+    SEGMENT_SECONDS: int = 300
+    SEGMENT_OVERLAP: int = 30
+    SEGMENT_WORKERS: int = 3
+    SEGMENT_RETRIES: int = 2
+    CONDENSE_FPS: float = 2.0  # frames per second sampled for scene detection
+    SCENE_CHANGE_THRESHOLD: float = 2.0  # mean pixel change (0-255) below which frames count as static
+    MIN_STATIC_SECONDS: float = 3.0
+    CONDENSE_PADDING: float = 0.5
+    MIN_SECONDS_SAVED: float = 10.0
     VIDEO_EXTENSIONS: list = None
+    CACHE_FILE: str = "analysis_cache.json"
+    CACHE_MAX_ENTRIES: int = 1000
+    CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    BATCH_POLL_INTERVAL: float = 60.0  # seconds between batch job status checks
+    BATCH_TIMEOUT: float = 24 * 3600
+    WATCH_STATE_FILE: str = "watch_state.json"  # files already handed to the watcher's callback
+    WATCH_SETTLE_SECONDS: float = 5.0  # unchanged this long = finished writing
+    WATCH_RESCAN_INTERVAL: float = 300.0
+    JOURNAL_FSYNC_INTERVAL: float = 1.0  # seconds between fsyncs of the analysis journal
+    JOURNAL_COMPACT_MIN_BYTES: int = 1024 * 1024
+    REMOTE_FILES_MANIFEST: str = "remote_files.json"
+    REMOTE_FILE_TTL: float = 48 * 3600  # Gemini deletes uploads after this long
+    REMOTE_FILE_REFRESH_MARGIN: float = 3600  # re-check uploads this close to expiry
 
     def __post_init__(self):
         self.VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
@@ -22,20 +48,23 @@ class Config:
 import os
 import json
 import logging
+import threading
 from typing import Dict, List, Tuple
 import google.generativeai as genai
 import time
+from .journal import AnalysisJournal
+from .metrics import metrics
+from .resilience import poll_delay
 
 class VideoManager:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, client=None):
         self.config = config
-        self.processed_videos = self._load_processed_videos()
-        
-    def _load_processed_videos(self) -> Dict:
-        if os.path.exists(self.config.PROCESSED_VIDEOS_LOG):
-            with open(self.config.PROCESSED_VIDEOS_LOG, "r") as f:
-                return json.load(f)
-        return {}
+        # `genai` itself or a per-key client with the same functions (see gemini_clients.py)
+        self.client = client or genai
+        self.journal = AnalysisJournal(config.PROCESSED_VIDEOS_LOG, config.JOURNAL_FSYNC_INTERVAL,
+                                       config.JOURNAL_COMPACT_MIN_BYTES)
+        self.processed_videos = self.journal.load()
+        self._save_lock = threading.Lock()
 
     def list_video_files(self) -> List[str]:
         if not os.path.exists(self.config.VIDEO_DIR):
@@ -49,57 +78,276 @@ class VideoManager:
 
     def get_uploaded_files(self) -> Dict:
         try:
-            return {file.display_name: file for file in genai.list_files()}
+            return {file.display_name: file for file in self.client.list_files()}
         except Exception as e:
             logging.error(f"Error retrieving uploaded files: {e}")
             return {}
 
     def upload_video(self, file_path: str):
         logging.info(f"Uploading {file_path}...")
-        video_file = genai.upload_file(path=file_path)
+        with metrics.span("upload"):
+            video_file = self.client.upload_file(path=file_path)
         logging.info(f"Uploaded: {video_file.uri}, waiting for activation...")
 
-        elapsed_time = 0
-        while elapsed_time < self.config.MAX_WAIT_TIME:
-            video_status = genai.get_file(video_file.name)
-            if video_status.state == "ACTIVE":
+        start = time.monotonic()
+        attempt = 0
+        while time.monotonic() - start < self.config.MAX_WAIT_TIME:
+            state = self.client.get_file(video_file.name).state.name
+            if state == "ACTIVE":
                 logging.info(f"File {file_path} is now ACTIVE.")
+                metrics.observe("video_stage_seconds", time.monotonic() - start, stage="activate", status="ok")
                 return video_file
-            time.sleep(self.config.WAIT_INTERVAL)
-            elapsed_time += self.config.WAIT_INTERVAL
-            logging.info(f"Waiting... {elapsed_time}s elapsed")
+            if state == "FAILED":
+                break
+            time.sleep(poll_delay(attempt, self.config.POLL_INITIAL_INTERVAL, self.config.WAIT_INTERVAL))
+            attempt += 1
+            logging.info(f"Waiting... {time.monotonic() - start:.0f}s elapsed")
 
         logging.error(f"File {file_path} did not become ACTIVE within {self.config.MAX_WAIT_TIME}s.")
         return None
 
     def save_analysis(self, filename: str, analysis_data: Dict):
-        self.processed_videos[filename] = analysis_data
-        with open(self.config.PROCESSED_VIDEOS_LOG, "w") as f:
-            json.dump(self.processed_videos, f, indent=4)
+        self.save_analyses({filename: analysis_data})
+
+    def save_analyses(self, analyses: Dict[str, Dict]):
+        """Store many analyses with a single append to the journal."""
+        with self._save_lock:
+            self.processed_videos.update(analyses)
+            if self.journal.append(analyses):
+                self.journal.compact(self.processed_videos)
+
+    def compact(self):
+        """Fold the journal into PROCESSED_VIDEOS_LOG, so it holds every analysis again."""
+        with self._save_lock:
+            self.journal.compact(self.processed_videos)
+
+    def export(self, path: str):
+        """Write every analysis to `path` in the processed_videos.json format."""
+        with self._save_lock:
+            data = json.dumps(self.processed_videos, indent=4)
+        with open(path, "w") as f:
+            f.write(data)
+
+# uploader.py
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+class ConcurrentUploader:
+    """Uploads many files in parallel and waits for all of them in one poll loop.
+
+    Uploads run on a thread pool. Each finished upload joins a shared schedule
+    of activation checks, polled with exponential backoff and jitter, and
+    `on_active(path, video_file)` is called as soon as that file turns ACTIVE,
+    so a batch takes about as long as its slowest activation.
+    """
+
+    def __init__(self, config: Config, max_workers: Optional[int] = None, client=None):
+        self.config = config
+        self.max_workers = max_workers or config.UPLOAD_WORKERS
+        self.client = client or genai
+
+    def upload_many(self, paths: List[str], on_active: Optional[Callable] = None) -> Dict:
+        """Returns {path: video_file}, with None for files that failed or timed out."""
+        results = {}
+        waiting = []  # heap of (next poll time, seq, path, video_file, attempt, deadline)
+        ready = threading.Condition()
+        uploads_left = len(paths)
+        seq = 0
+
+        def upload(path):
+            nonlocal uploads_left, seq
+            try:
+                logging.info(f"Uploading {path}...")
+                with metrics.span("upload"):
+                    video_file = self.client.upload_file(path=path)
+            except Exception as e:
+                logging.error(f"Upload of {path} failed: {e}")
+                video_file = None
+            with ready:
+                uploads_left -= 1
+                if video_file is None:
+                    results[path] = None
+                else:
+                    now = time.monotonic()
+                    seq += 1
+                    heapq.heappush(waiting, (now, seq, path, video_file, 0, now + self.config.MAX_WAIT_TIME))
+                ready.notify()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for path in paths:
+                pool.submit(upload, path)
+
+            while True:
+                with ready:
+                    while True:
+                        now = time.monotonic()
+                        if waiting and waiting[0][0] <= now:
+                            _, _, path, video_file, attempt, deadline = heapq.heappop(waiting)
+                            break
+                        if not waiting and not uploads_left:
+                            return results
+                        ready.wait(timeout=waiting[0][0] - now if waiting else None)
+
+                state = self._poll_state(video_file)
+                if state == "ACTIVE":
+                    logging.info(f"File {path} is now ACTIVE.")
+                    uploaded_at = deadline - self.config.MAX_WAIT_TIME
+                    metrics.observe("video_stage_seconds", time.monotonic() - uploaded_at, stage="activate", status="ok")
+                    results[path] = video_file
+                    if on_active:
+                        on_active(path, video_file)
+                    continue
+                if state == "FAILED" or time.monotonic() >= deadline:
+                    logging.error(f"File {path} did not become ACTIVE within {self.config.MAX_WAIT_TIME}s.")
+                    results[path] = None
+                    continue
+                delay = poll_delay(attempt, self.config.POLL_INITIAL_INTERVAL, self.config.WAIT_INTERVAL)
+                with ready:
+                    seq += 1
+                    heapq.heappush(waiting, (time.monotonic() + delay, seq, path, video_file, attempt + 1, deadline))
+
+    def _poll_state(self, video_file) -> str:
+        try:
+            return self.client.get_file(video_file.name).state.name
+        except Exception as e:
+            logging.warning(f"Could not check {video_file.name}: {e}")
+            return "PROCESSING"
 
 # analysis_service.py
 import re
 import json
-from typing import Dict
+from typing import Callable, Dict, Optional
 import google.generativeai as genai
+from .resilience import InferencePolicy
+from .schema import ANALYSIS_SCHEMA, AnalysisValidationError, DecodeStats, GameAnalysis
+from .streaming import ANALYSIS_KEYS, IncrementalAnalysisParser
 
 class AnalysisService:
-    def __init__(self):
-        self.model = genai.GenerativeModel(model_name="models/gemini-2.0-flash")
+    """Sends videos to Gemini and decodes the analyses.
+
+    With `structured=True` the request carries ANALYSIS_SCHEMA as its
+    response schema, so the response is plain JSON that is decoded
+    directly; pair it with a prompt built with include_example=False.
+    Requests go through an InferencePolicy (retries with backoff by
+    default; hedging and a fallback model when configured).
+    """
+
+    def __init__(self, model_name: str = "models/gemini-2.0-flash", client=None,
+                 structured: bool = False, stats: Optional[DecodeStats] = None,
+                 policy: Optional[InferencePolicy] = None):
+        self.model_name = model_name
+        self.client = client or genai
+        self.model = self.client.GenerativeModel(model_name=model_name)
+        self._models = {model_name: self.model}
+        self.policy = policy or InferencePolicy()
+        self.structured = structured
+        self.stats = stats or DecodeStats()
+        self.generation_config = (
+            {"response_mime_type": "application/json", "response_schema": ANALYSIS_SCHEMA} if structured else None
+        )
+
+    def _model(self, model_name: str):
+        if model_name not in self._models:
+            self._models.setdefault(model_name, self.client.GenerativeModel(model_name=model_name))
+        return self._models[model_name]
 
     def analyze_video(self, video_file, prompt: str) -> str:
         logging.info(f"Sending {video_file.display_name} for analysis...")
-        response = self.model.generate_content(
-            [prompt, video_file], 
-            request_options={"timeout": 600}
-        )
-        return response.text
+
+        def call(model_name, timeout):
+            response = self._model(model_name).generate_content(
+                [prompt, video_file],
+                generation_config=self.generation_config,
+                request_options={"timeout": timeout}
+            )
+            metrics.record_usage(model_name, getattr(response, "usage_metadata", None))
+            return response.text
+
+        with metrics.span("generate"):
+            return self.policy.run(call, self.model_name)
+
+    def analyze_video_stream(self, video_file, prompt: str,
+                             on_entry: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+        """Stream the analysis and call `on_entry(section, entry)` for each mistake or missed opportunity as it arrives.
+
+        Returns the complete, validated analysis. Failed requests are only
+        retried until the first entry has been handed to `on_entry`.
+        """
+        logging.info(f"Streaming analysis of {video_file.display_name}...")
+        emitted = False
+
+        def call(model_name, timeout):
+            nonlocal emitted
+            response = self._model(model_name).generate_content(
+                [prompt, video_file],
+                stream=True,
+                generation_config=self.generation_config,
+                request_options={"timeout": timeout}
+            )
+            parser = IncrementalAnalysisParser()
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:  # chunk without text, e.g. only safety ratings
+                    continue
+                for section, entry in parser.feed(text):
+                    emitted = True
+                    if on_entry:
+                        on_entry(section, entry)
+            metrics.record_usage(model_name, getattr(response, "usage_metadata", None))
+            return parser
+
+        with metrics.span("generate"):
+            parser = self.policy.run(call, self.model_name, hedge=False, can_retry=lambda: not emitted)
+        with metrics.span("decode"):
+            return self._validate(parser.result, parser.text)
+
+    def decode(self, response_text: str) -> Dict:
+        """Validated analysis from a response of analyze_video.
+
+        Structured responses are loaded as they are; others are searched for
+        the JSON object first. Raises ValueError when no usable analysis can
+        be recovered.
+        """
+        with metrics.span("decode"):
+            try:
+                data = json.loads(response_text) if self.structured else self.extract_json(response_text)
+            except ValueError:
+                data = None
+            return self._validate(data, response_text)
+
+    def _validate(self, data, response_text: str) -> Dict:
+        try:
+            analysis = GameAnalysis.from_dict(data)
+            self.stats.record()
+        except AnalysisValidationError as e:
+            repairs = []
+            try:
+                analysis = GameAnalysis.from_dict(self.extract_json(response_text), repairs)
+            except ValueError:
+                self.stats.record(failed=True)
+                raise
+            self.stats.record(failed=True, repaired=True)
+            logging.warning(f"Analysis failed validation ({e}), repaired without a retry: "
+                            f"{'; '.join(repairs) or 'extracted from text'} ({self.stats})")
+        return analysis.to_dict()
 
     @staticmethod
     def extract_json(response: str) -> Dict:
-        match = re.search(r'\{.*\}', response, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
+        """The first JSON object in `response` that looks like an analysis.
+
+        Every "{" is tried as a start, so prose or stray braces before and
+        after the JSON do not break the parse.
+        """
+        decoder = json.JSONDecoder()
+        for match in re.finditer(r'\{', response):
+            try:
+                data, _ = decoder.raw_decode(response, match.start())
+            except ValueError:
+                continue
+            if isinstance(data, dict) and any(key in data for key in ANALYSIS_KEYS):
+                return data
         raise ValueError("No valid JSON found")
 
     @staticmethod
@@ -170,9 +418,12 @@ def format_analysis(json_data):
 
     return output
 # Dynamic prompt
-def dynamic_game_prompt_template(game_name: str, focus_on: str = None) -> str:
+def dynamic_game_prompt_template(game_name: str, focus_on: str = None, include_example: bool = True) -> str:
     """Generates a dynamic game-specific prompt where the LLM determines key mistakes and better alternatives,
-       with an optional focus area for more specific feedback."""
+       with an optional focus area for more specific feedback.
+
+       Without `include_example` the JSON example is replaced by a one-line field list, for requests
+       whose format is already fixed by a response schema."""
 
     focus_text = (
         f"\n### **Special Focus: {focus_on.capitalize()}**\n"
@@ -182,22 +433,7 @@ def dynamic_game_prompt_template(game_name: str, focus_on: str = None) -> str:
         if focus_on else ""
     )
 
-    return (
-        f"You are an expert video game coach specializing in analyzing gameplay for {game_name}.\n"
-        f"Your task is to analyze a gameplay video and provide **a comprehensive, mistake-focused breakdown** based on the game's mechanics, strategies, and execution.\n\n"
-
-        f"### **Step 1: Identify Key Focus Areas for Analysis**\n"
-        f"- Before analyzing the video, list at least **6-8 key factors** that influence success in {game_name}.\n"
-        f"- These could include mechanics, strategy, decision-making, positioning, adaptability, execution, etc.\n"
-        f"- Weigh their importance before selecting the **4-5 most critical areas** for identifying mistakes.\n\n"
-
-        f"### **Step 2: Extract and List All Mistakes & Better Alternatives**\n"
-        f"Provide an exhaustive breakdown of **all major mistakes** made by the player, along with better choices they could have made.\n"
-        f"- Each mistake must be accompanied by a **timestamp** and a specific explanation of why it was incorrect.\n"
-        f"- Provide **a clearly superior alternative action** with a rationale for why it would have been better.\n\n"
-        
-        + focus_text +
-
+    output_example = (
         f"### **Output Format:**\n"
         f"Return the analysis strictly in the following JSON format:\n"
         f"```json\n"
@@ -234,6 +470,32 @@ def dynamic_game_prompt_template(game_name: str, focus_on: str = None) -> str:
         f"  ]\n"
         f"}}\n"
         f"```\n\n"
+    )
+
+    output_fields = (
+        f"### **Output Format:**\n"
+        f"Return JSON with game, key_focus_areas, mistakes (timestamp, description, why_incorrect, "
+        f"better_alternative, expected_benefit), repeated_errors (pattern, occurrences, fix) and "
+        f"missed_opportunities (timestamp, missed_action, expected_outcome). Timestamps are HH:MM:SS.\n\n"
+    )
+
+    return (
+        f"You are an expert video game coach specializing in analyzing gameplay for {game_name}.\n"
+        f"Your task is to analyze a gameplay video and provide **a comprehensive, mistake-focused breakdown** based on the game's mechanics, strategies, and execution.\n\n"
+
+        f"### **Step 1: Identify Key Focus Areas for Analysis**\n"
+        f"- Before analyzing the video, list at least **6-8 key factors** that influence success in {game_name}.\n"
+        f"- These could include mechanics, strategy, decision-making, positioning, adaptability, execution, etc.\n"
+        f"- Weigh their importance before selecting the **4-5 most critical areas** for identifying mistakes.\n\n"
+
+        f"### **Step 2: Extract and List All Mistakes & Better Alternatives**\n"
+        f"Provide an exhaustive breakdown of **all major mistakes** made by the player, along with better choices they could have made.\n"
+        f"- Each mistake must be accompanied by a **timestamp** and a specific explanation of why it was incorrect.\n"
+        f"- Provide **a clearly superior alternative action** with a rationale for why it would have been better.\n\n"
+        
+        + focus_text +
+
+        (output_example if include_example else output_fields) +
 
         f"### **Important Instructions:**\n"
         f"- **Only return JSON output**—do not include any additional text.\n"
@@ -248,10 +510,13 @@ def dynamic_game_prompt_template(game_name: str, focus_on: str = None) -> str:
 # prompt_generator.py
 class PromptGenerator:
     @staticmethod
-    def create_game_prompt(game_name: str, focus_on: str = None) -> str:
-        return dynamic_game_prompt_template(game_name, focus_on)
+    def create_game_prompt(game_name: str, focus_on: str = None, include_example: bool = True) -> str:
+        return dynamic_game_prompt_template(game_name, focus_on, include_example)
 
 # main.py
+from typing import Iterable
+from .media_info import estimate_video_seconds
+
 def initialize_services(api_key: str):
     genai.configure(api_key=api_key)
     config = Config()
@@ -259,41 +524,182 @@ def initialize_services(api_key: str):
     analysis_service = AnalysisService()
     return config, video_manager, analysis_service
 
-def process_videos(video_manager: VideoManager, analysis_service: AnalysisService, game_name: str):
-    uploaded_files = video_manager.get_uploaded_files()
-    new_videos = []
+def select_new_videos(video_manager: VideoManager, prompt: str, model_name: str, cache=None,
+                      paths: Optional[List[str]] = None, changed: Iterable[str] = ()
+                      ) -> Tuple[List[Tuple[str, str, Optional[str]]], Dict[str, List[str]]]:
+    """Find the videos in the video directory (or in `paths`) that still need analysis.
+
+    Returns (videos, duplicates): `videos` is a list of (path, filename, cache_key)
+    and `duplicates` maps a cache key to other filenames with the same content,
+    which should receive the same analysis. Without a cache, videos are
+    matched by filename and cache keys are None. Paths in `changed` were
+    rewritten since they were analyzed, so their stored analysis is not
+    reused.
+
+    With an AnalysisCache, videos are matched by content rather than filename:
+    clips whose bytes were already analyzed with the same prompt and model
+    are stored straight from the cache without uploading or calling Gemini.
+    """
+    videos = []
+    duplicates = {}
+    changed = {os.path.basename(path) for path in changed}
 
-    for video_path in video_manager.list_video_files():
+    for video_path in video_manager.list_video_files() if paths is None else paths:
         filename = os.path.basename(video_path)
-
-        if filename in video_manager.processed_videos:
+        processed = filename in video_manager.processed_videos and filename not in changed
+
+        cache_key = None
+        if cache is not None:
+            previous_hash = cache.previous_hash(video_path)
+            content_hash = cache.content_hash(video_path)
+            cache_key = cache.make_key(content_hash, prompt, model_name)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"Cache hit for {filename}, skipping upload and analysis.")
+                if video_manager.processed_videos.get(filename) != cached:
+                    video_manager.save_analysis(filename, cached)
+                continue
+            if processed and previous_hash in (None, content_hash):
+                # Analyzed before the cache knew about it; adopt the stored result
+                logging.info(f"Skipping processed video: {filename}")
+                cache.put(cache_key, video_manager.processed_videos[filename])
+                continue
+            if cache_key in duplicates:
+                logging.info(f"Video {filename} has the same content as a queued video, skipping upload.")
+                duplicates[cache_key].append(filename)
+                continue
+            duplicates[cache_key] = []
+        elif processed:
             logging.info(f"Skipping processed video: {filename}")
             continue
 
-        if filename in uploaded_files:
+        videos.append((video_path, filename, cache_key))
+
+    return videos, duplicates
+
+def process_videos(video_manager: VideoManager, analysis_service: AnalysisService, game_name: str,
+                   cache=None, uploader: ConcurrentUploader = None, segmenter=None, condenser=None,
+                   paths: Optional[List[str]] = None, remote_files=None, changed: Iterable[str] = ()):
+    """Analyze every new video in the video directory, or only those in `paths`.
+
+    New videos are uploaded concurrently, shortest first, and each one is
+    analyzed as soon as Gemini reports it ACTIVE, on up to ANALYSIS_WORKERS
+    threads. See select_new_videos for how an AnalysisCache and `changed`
+    change which videos are new.
+    With a SegmentedAnalyzer, videos longer than SEGMENT_MIN_DURATION are
+    analyzed as overlapping windows instead of one request. With a
+    KeyframeCondenser, static stretches are cut out before upload, the
+    condensed clips are removed once uploaded, and the analysis timestamps
+    are mapped back onto the original video. With a
+    RemoteFileManifest, earlier uploads are found by content hash instead of
+    listing the remote files, and uploads are deleted once analyzed.
+    """
+    prompt = PromptGenerator().create_game_prompt(game_name, include_example=not analysis_service.structured)
+    changed = {os.path.basename(path) for path in changed}
+    new_videos, duplicates = select_new_videos(video_manager, prompt, analysis_service.model_name, cache, paths,
+                                               changed)
+    # Shortest first, so short clips are not stuck behind a full match
+    new_videos.sort(key=lambda video: estimate_video_seconds(video[0]))
+    uploaded_files = (video_manager.get_uploaded_files()
+                      if new_videos and cache is None and remote_files is None else {})
+    ready_videos = []  # (filename, video_file, cache_key) already on Gemini
+    to_upload = {}     # video path -> (filename, cache_key)
+    long_videos = []   # (filename, video_path, cache_key) analyzed in windows
+    timestamp_maps = {}  # filename -> TimestampMap for condensed uploads
+
+    for video_path, filename, cache_key in new_videos:
+        if segmenter is not None and segmenter.should_segment(video_path):
+            long_videos.append((filename, video_path, cache_key))
+            continue
+        if remote_files is not None:
+            video_file = remote_files.get(video_path)
+        else:
+            # Matched by name, so the earlier upload of a rewritten file is out of date
+            video_file = uploaded_files.get(filename) if filename not in changed else None
+        if video_file is not None:
             logging.info(f"Video {filename} already uploaded, skipping upload.")
-            video_file = uploaded_files[filename]
+            ready_videos.append((filename, video_file, cache_key))
         else:
-            video_file = video_manager.upload_video(video_path)
-            if not video_file:
-                continue
-
-        new_videos.append((filename, video_file))
+            to_upload[video_path] = (filename, cache_key)
+
+    if condenser is not None and to_upload:
+        def condense(video_path):
+            try:
+                with metrics.span("condense"):
+                    return condenser.condense(video_path)
+            except Exception as e:
+                logging.warning(f"Could not condense {video_path}, uploading it as is: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=video_manager.config.UPLOAD_WORKERS) as pool:
+            condensed_videos = list(pool.map(condense, list(to_upload)))
+        for video_path, condensed in zip(list(to_upload), condensed_videos):
+            if condensed is not None:
+                filename, cache_key = to_upload.pop(video_path)
+                to_upload[condensed.path] = (filename, cache_key)
+                timestamp_maps[filename] = condensed.timestamp_map
+        logging.info(f"Condensing saved {condenser.seconds_saved:.0f}s of video "
+                     f"and {condenser.bytes_saved / 1e6:.1f}MB of upload")
 
     if not new_videos:
         logging.info("No new videos to analyze.")
-        return
-
-    logging.info(f"Processing {len(new_videos)} new videos.")
-    prompt_generator = PromptGenerator()
+    else:
+        logging.info(f"Processing {len(new_videos)} new videos.")
 
-    for filename, video_file in new_videos:
-        prompt = prompt_generator.create_game_prompt(game_name)
+    def analyze(filename, video_file, cache_key):
         response_text = analysis_service.analyze_video(video_file, prompt)
-        json_data = analysis_service.extract_json(response_text)
+        store(filename, analysis_service.decode(response_text), cache_key)
+        if remote_files is not None:
+            remote_files.release(video_file.name)
+
+    def analyze_segmented(filename, video_path, cache_key):
+        store(filename, segmenter.analyze(video_path, prompt), cache_key)
+
+    def store(filename, json_data, cache_key):
+        if filename in timestamp_maps:
+            json_data = timestamp_maps[filename].remap_analysis(json_data)
         formatted_analysis = analysis_service.format_analysis(json_data)
         logging.info(f"Analysis for {filename}:\n{formatted_analysis}")
-        video_manager.save_analysis(filename, json_data)
+        analyses = {filename: json_data}
+        if cache_key is not None:
+            cache.put(cache_key, json_data)
+            analyses.update((duplicate, json_data) for duplicate in duplicates[cache_key])
+        with metrics.span("persist"):
+            video_manager.save_analyses(analyses)
+
+    # Each upload moves on to analysis the moment it turns ACTIVE
+    with ThreadPoolExecutor(max_workers=video_manager.config.ANALYSIS_WORKERS) as analysis_pool:
+        futures = {analysis_pool.submit(analyze, *video): video[0] for video in ready_videos}
+        for video in long_videos:
+            futures[analysis_pool.submit(analyze_segmented, *video)] = video[0]
+
+        def on_active(video_path, video_file):
+            filename, cache_key = to_upload[video_path]
+            if filename in timestamp_maps:
+                condenser.remove(video_path)  # the upload is all that is needed now
+            if remote_files is not None and filename not in timestamp_maps:
+                remote_files.record(video_path, video_file)
+            futures[analysis_pool.submit(analyze, filename, video_file, cache_key)] = filename
+
+        if to_upload:
+            uploader = uploader or ConcurrentUploader(video_manager.config, client=video_manager.client)
+            uploader.upload_many(list(to_upload), on_active=on_active)
+            for video_path, (filename, _) in to_upload.items():
+                if filename in timestamp_maps:
+                    condenser.remove(video_path)  # uploads that failed
+
+        for future, filename in list(futures.items()):
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Analysis of {filename} failed: {e}")
+
+    # Folded only once it outgrows the snapshot (see save_analyses), not rewritten every run
+    video_manager.journal.sync()
+    logging.info(f"Response decoding: {analysis_service.stats}")
+    if cache is not None:
+        cache.save()
+        logging.info(f"Analysis cache: {cache.stats()}")
 
 # Usage example
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from google import genai as google_genai  # pip install google-genai, only needed for GeminiBatchBackend
+except ImportError:
+    google_genai = None
+
+from .backend import AnalysisService, ConcurrentUploader, PromptGenerator, VideoManager, select_new_videos
+from .schema import ANALYSIS_SCHEMA
+
+
+class BatchJobError(Exception):
+    """A batch job failed, was cancelled or did not finish in time."""
+
+
+class BatchBackend:
+    """Where batch request files are run.
+
+    `submit` takes a JSONL file of GenerateContent requests and returns a job
+    id, `state` reports "running", "succeeded" or "failed", and `download`
+    writes the JSONL results of a succeeded job to a local path.
+    """
+
+    def submit(self, requests_path: str, model_name: str) -> str:
+        raise NotImplementedError
+
+    def state(self, job_id: str) -> str:
+        raise NotImplementedError
+
+    def download(self, job_id: str, results_path: str):
+        raise NotImplementedError
+
+
+class GeminiBatchBackend(BatchBackend):
+    """Gemini Batch API, through the google-genai SDK."""
+
+    STATES = {
+        "JOB_STATE_SUCCEEDED": "succeeded",
+        "JOB_STATE_FAILED": "failed",
+        "JOB_STATE_CANCELLED": "failed",
+        "JOB_STATE_EXPIRED": "failed",
+    }
+
+    def __init__(self, api_key: Optional[str] = None):
+        if google_genai is None:
+            raise RuntimeError("google-genai is required for Gemini batch jobs (pip install google-genai)")
+        self.client = google_genai.Client(api_key=api_key)
+
+    def submit(self, requests_path: str, model_name: str) -> str:
+        uploaded = self.client.files.upload(
+            file=requests_path,
+            config={"display_name": os.path.basename(requests_path), "mime_type": "jsonl"},
+        )
+        job = self.client.batches.create(
+            model=model_name, src=uploaded.name, config={"display_name": os.path.basename(requests_path)}
+        )
+        return job.name
+
+    def state(self, job_id: str) -> str:
+        return self.STATES.get(self.client.batches.get(name=job_id).state.name, "running")
+
+    def download(self, job_id: str, results_path: str):
+        job = self.client.batches.get(name=job_id)
+        with open(results_path, "wb") as f:
+            f.write(self.client.files.download(file=job.dest.file_name))
+
+
+class LocalBatchBackend(BatchBackend):
+    """Runs batch files in-process with `respond(request) -> response text`.
+
+    Stands in for the Gemini Batch API in tests and dry runs. Jobs run on a
+    background thread, so callers go through the same polling as for a
+    remote job.
+    """
+
+    def __init__(self, respond: Callable[[Dict], str]):
+        self.respond = respond
+        self._jobs: Dict[str, Tuple[threading.Thread, List[str]]] = {}
+
+    def submit(self, requests_path: str, model_name: str) -> str:
+        job_id = uuid.uuid4().hex
+        lines: List[str] = []
+
+        def run():
+            with open(requests_path, "r") as f:
+                for line in f:
+                    item = json.loads(line)
+                    try:
+                        text = self.respond(item["request"])
+                        result = {"key": item["key"],
+                                  "response": {"candidates": [{"content": {"parts": [{"text": text}]}}]}}
+                    except Exception as e:
+                        result = {"key": item["key"], "error": {"message": str(e)}}
+                    lines.append(json.dumps(result))
+
+        thread = threading.Thread(target=run, daemon=True)
+        self._jobs[job_id] = (thread, lines)
+        thread.start()
+        return job_id
+
+    def state(self, job_id: str) -> str:
+        return "running" if self._jobs[job_id][0].is_alive() else "succeeded"
+
+    def download(self, job_id: str, results_path: str):
+        with open(results_path, "w") as f:
+            f.write("".join(line + "\n" for line in self._jobs[job_id][1]))
+
+
+def _rest_schema(schema: Dict) -> Dict:
+    """ANALYSIS_SCHEMA with the upper-case type names the REST API expects."""
+    converted = {**schema, "type": schema["type"].upper()}
+    if "items" in schema:
+        converted["items"] = _rest_schema(schema["items"])
+    if "properties" in schema:
+        converted["properties"] = {name: _rest_schema(value) for name, value in schema["properties"].items()}
+    return converted
+
+
+def write_batch_requests(path: str, videos: List[Tuple[str, object]], prompt: str, structured: bool = False) -> int:
+    """Write one GenerateContent request per (key, uploaded video file) to `path`. Returns the count."""
+    generation_config = (
+        {"response_mime_type": "application/json", "response_schema": _rest_schema(ANALYSIS_SCHEMA)}
+        if structured else None
+    )
+    with open(path, "w") as f:
+        for key, video_file in videos:
+            request = {"contents": [{"role": "user", "parts": [
+                {"text": prompt},
+                {"file_data": {"file_uri": video_file.uri, "mime_type": video_file.mime_type}},
+            ]}]}
+            if generation_config:
+                request["generation_config"] = generation_config
+            f.write(json.dumps({"key": key, "request": request}) + "\n")
+    return len(videos)
+
+
+def read_batch_results(path: str) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """Yield (key, response text, error) for every line of a results file."""
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "error" in item:
+                yield item["key"], None, item["error"].get("message", str(item["error"]))
+                continue
+            try:
+                parts = item["response"]["candidates"][0]["content"]["parts"]
+                yield item["key"], "".join(part.get("text", "") for part in parts), None
+            except (KeyError, IndexError) as e:
+                yield item["key"], None, f"Malformed response: {e}"
+
+
+def wait_for_batch(backend: BatchBackend, job_id: str, poll_interval: float, timeout: float):
+    start = time.monotonic()
+    while True:
+        state = backend.state(job_id)
+        if state == "succeeded":
+            return
+        if state == "failed":
+            raise BatchJobError(f"Batch job {job_id} failed")
+        if time.monotonic() - start >= timeout:
+            raise BatchJobError(f"Batch job {job_id} did not finish within {timeout:.0f}s")
+        logging.info(f"Batch job {job_id} still running ({time.monotonic() - start:.0f}s elapsed)")
+        time.sleep(poll_interval)
+
+
+def process_videos_batch(video_manager: VideoManager, analysis_service: AnalysisService, game_name: str,
+                         backend: BatchBackend, work_dir: str, cache=None,
+                         uploader: Optional[ConcurrentUploader] = None, remote_files=None) -> Dict:
+    """Analyze every new video with one batch job instead of one request per video.
+
+    Meant for large backfills where throughput and cost matter more than
+    latency. New videos are uploaded, one request line per video is written
+    to `<work_dir>/<run>.requests.jsonl` and submitted to `backend`, which is
+    polled every BATCH_POLL_INTERVAL seconds. The results file is decoded and
+    stored with a single save. With a RemoteFileManifest, earlier uploads are
+    reused by content hash and released once their analysis is stored.
+    Returns {"completed": n, "failed": {filename: error}}.
+    """
+    config = video_manager.config
+    os.makedirs(work_dir, exist_ok=True)
+    prompt = PromptGenerator.create_game_prompt(game_name, include_example=not analysis_service.structured)
+    new_videos, duplicates = select_new_videos(video_manager, prompt, analysis_service.model_name, cache)
+    if not new_videos:
+        logging.info("No new videos to analyze.")
+        return {"completed": 0, "failed": {}}
+
+    cache_keys = {filename: cache_key for _, filename, cache_key in new_videos}
+    if remote_files is not None:
+        uploaded_files = {filename: remote_files.get(path) for path, filename, _ in new_videos}
+    else:
+        uploaded_files = video_manager.get_uploaded_files() if cache is None else {}
+    ready = [(filename, uploaded_files[filename]) for _, filename, _ in new_videos
+             if uploaded_files.get(filename) is not None]
+    to_upload = {path: filename for path, filename, _ in new_videos if uploaded_files.get(filename) is None}
+    failed = {}
+    if to_upload:
+        uploader = uploader or ConcurrentUploader(config, client=video_manager.client)
+        for path, video_file in uploader.upload_many(list(to_upload)).items():
+            if video_file is None:
+                failed[to_upload[path]] = "upload did not become ACTIVE"
+            else:
+                ready.append((to_upload[path], video_file))
+                if remote_files is not None:
+                    remote_files.record(path, video_file)
+
+    if not ready:
+        logging.warning(f"None of the {len(new_videos)} new videos could be uploaded, not submitting a batch job")
+        return {"completed": 0, "failed": failed}
+
+    run_id = time.strftime("%Y%m%d-%H%M%S")
+    requests_path = os.path.join(work_dir, f"{run_id}.requests.jsonl")
+    results_path = os.path.join(work_dir, f"{run_id}.results.jsonl")
+    count = write_batch_requests(requests_path, ready, prompt, analysis_service.structured)
+    job_id = backend.submit(requests_path, analysis_service.model_name)
+    logging.info(f"Submitted batch job {job_id} with {count} videos")
+    wait_for_batch(backend, job_id, config.BATCH_POLL_INTERVAL, config.BATCH_TIMEOUT)
+    backend.download(job_id, results_path)
+
+    analyses = {}
+    for filename, response_text, error in read_batch_results(results_path):
+        if error is None:
+            try:
+                analyses[filename] = analysis_service.decode(response_text)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            logging.error(f"Batch analysis of {filename} failed: {error}")
+            failed[filename] = error
+            continue
+        cache_key = cache_keys.get(filename)
+        if cache_key is not None:
+            cache.put(cache_key, analyses[filename])
+            for duplicate in duplicates[cache_key]:
+                analyses[duplicate] = analyses[filename]
+
+    for filename, _ in ready:
+        if filename not in analyses and filename not in failed:
+            failed[filename] = "missing from the batch results"
+
+    video_manager.save_analyses(analyses)
+    video_manager.compact()
+    if cache is not None:
+        cache.save()
+    if remote_files is not None:
+        for filename, video_file in ready:
+            if filename in analyses:
+                remote_files.release(video_file.name)
+    logging.info(f"Batch job {job_id}: stored {len(analyses)} analyses, {len(failed)} failed "
+                 f"(response decoding: {analysis_service.stats})")
+    return {"completed": len(analyses), "failed": failed}
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class FileHashes:
+    """sha256 of local files, remembered per path together with size and mtime.
+
+    An unchanged file is only read once; share one instance between an
+    AnalysisCache and a RemoteFileManifest so a run hashes each video once.
+    """
+
+    def __init__(self, known: Optional[Dict[str, Dict]] = None):
+        self._files: Dict[str, Dict] = dict(known or {})  # absolute path -> size, mtime_ns, sha256
+        self._lock = threading.Lock()
+
+    def content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        with self._lock:
+            known = self._files.get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+        digest = file_sha256(path)
+        with self._lock:
+            self._files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        return digest
+
+    def known(self, path: str) -> Optional[Dict]:
+        """The size, mtime_ns and sha256 last recorded for `path`, if any."""
+        with self._lock:
+            return self._files.get(os.path.abspath(path))
+
+    def update(self, files: Dict[str, Dict]):
+        with self._lock:
+            self._files.update(files)
+
+    def to_dict(self) -> Dict[str, Dict]:
+        with self._lock:
+            return dict(self._files)
+
+
+class AnalysisCache:
+    """LRU cache of analyses keyed by (video content hash, prompt, model).
+
+    A hit means the same bytes were already analyzed with the same prompt and
+    model, so neither the Gemini upload nor generate_content is needed.
+    Entries are evicted least-recently-used first once `max_entries` or
+    `max_bytes` (size of the serialized analyses) is exceeded.
+
+    Content hashes are remembered per path together with size and mtime, so
+    unchanged files are not re-read on every run (see FileHashes).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024,
+                 hashes: Optional[FileHashes] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self.hashes = hashes or FileHashes()
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def make_key(content_hash: str, prompt: str, model_name: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{content_hash}:{prompt_hash}:{model_name}".encode("utf-8")).hexdigest()
+
+    def content_hash(self, path: str) -> str:
+        return self.hashes.content_hash(path)
+
+    def previous_hash(self, path: str) -> Optional[str]:
+        """Content hash recorded for `path` before its current contents, if any."""
+        known = self.hashes.known(path)
+        return known["sha256"] if known else None
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return analysis
+
+    def put(self, key: str, analysis: Dict):
+        size = len(json.dumps(analysis))
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._sizes[key]
+            self._entries[key] = analysis
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"entries": list(self._entries.items()), "files": self.hashes.to_dict()}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable analysis cache {self.path}: {e}")
+            return
+        self.hashes.update(data.get("files", {}))
+        # Stored oldest first, so replaying keeps the LRU order
+        for key, analysis in data.get("entries", []):
+            self.put(key, analysis)
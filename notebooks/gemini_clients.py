@@ -0,0 +1,105 @@
+import mimetypes
+import os
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from google.generativeai import protos
+from google.generativeai.types import file_types
+
+
+class GeminiClient:
+    """Gemini file and model clients bound to one API key.
+
+    `genai.configure` sets a single process-wide key, so two users analyzing
+    at the same time would overwrite each other's credentials. A GeminiClient
+    has its own client manager instead; its service clients (and their HTTP
+    or gRPC connections) are created once and reused for every call.
+
+    The methods have the same signatures as the google.generativeai module
+    functions, so either a GeminiClient or `genai` itself can be passed
+    wherever a `client` is accepted.
+    """
+
+    def __init__(self, api_key: str, transport: Optional[str] = None):
+        self._manager = genai_client._ClientManager()
+        self._manager.configure(api_key=api_key, transport=transport)
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self._lock = threading.Lock()
+
+    def _service(self, name: str):
+        with self._lock:
+            return self._manager.get_default_client(name)
+
+    def upload_file(self, path, mime_type: Optional[str] = None,
+                    display_name: Optional[str] = None) -> file_types.File:
+        path = pathlib.Path(os.fspath(path))
+        mime_type = mime_type or mimetypes.guess_type(path)[0]
+        if mime_type is None:
+            raise ValueError(f"Could not determine the mime type of {path}, please set `mime_type`")
+        proto = self._service("file").create_file(
+            path=path, mime_type=mime_type, display_name=display_name or path.name
+        )
+        return file_types.File(proto)
+
+    def get_file(self, name: str) -> file_types.File:
+        if "/" not in name:
+            name = f"files/{name}"
+        return file_types.File(self._service("file").get_file(name=name))
+
+    def list_files(self, page_size: int = 100) -> Iterable[file_types.File]:
+        for proto in self._service("file").list_files(protos.ListFilesRequest(page_size=page_size)):
+            yield file_types.File(proto)
+
+    def delete_file(self, name: str):
+        if "/" not in name:
+            name = f"files/{name}"
+        self._service("file").delete_file(request=protos.DeleteFileRequest(name=name))
+
+    def GenerativeModel(self, model_name: str) -> genai.GenerativeModel:
+        """Shared model for `model_name` that sends its requests with this client's key."""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name=model_name)
+                model._client = self._manager.get_default_client("generative")
+                self._models[model_name] = model
+            return model
+
+
+class GeminiClientRegistry:
+    """GeminiClients keyed by API key, least recently used first out.
+
+    At most `max_clients` are kept, and clients unused for `idle_timeout`
+    seconds are dropped on the next lookup. Dropped clients are not closed:
+    a worker may still be using one, and it releases its connections when
+    it is garbage collected.
+    """
+
+    def __init__(self, max_clients: int = 64, idle_timeout: float = 1800, transport: Optional[str] = None):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.transport = transport
+        self._clients = OrderedDict()  # api_key -> (last used, GeminiClient)
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> GeminiClient:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.pop(api_key, None)
+            while self._clients:
+                oldest_key, (last_used, _) = next(iter(self._clients.items()))
+                if len(self._clients) < self.max_clients and now - last_used < self.idle_timeout:
+                    break
+                del self._clients[oldest_key]
+            gemini_client = entry[1] if entry is not None else GeminiClient(api_key, self.transport)
+            self._clients[api_key] = (now, gemini_client)
+            return gemini_client
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clients)
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+
+class AnalysisJournal:
+    """processed_videos.json plus an append-only journal of the analyses saved since.
+
+    Saving appends one JSON line per video to `<snapshot>.journal` instead of
+    rewriting the snapshot, so storing N videos writes O(N) bytes and a
+    crash can lose at most the line being written. Appends are flushed at
+    once and fsync'ed at most every `fsync_interval` seconds, and always by
+    `sync`, `compact` and `close`.
+
+    `load` reads the snapshot and replays the journal over it. `compact`
+    writes the merged analyses as a new snapshot (to a temporary file that
+    is renamed into place) and empties the journal; `append` asks for it
+    once the journal outgrows both the snapshot and `compact_min_bytes`,
+    which keeps the total bytes written linear in the number of saves.
+    """
+
+    def __init__(self, snapshot_path: str, fsync_interval: float = 1.0, compact_min_bytes: int = 1024 * 1024):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + ".journal"
+        self.fsync_interval = fsync_interval
+        self.compact_min_bytes = compact_min_bytes
+        self._file = None
+        self._snapshot_bytes = 0
+        self._journal_bytes = 0
+        self._last_sync = 0.0
+        self._unsynced = False
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict]:
+        data = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
+            self._snapshot_bytes = os.path.getsize(self.snapshot_path)
+        if not os.path.exists(self.journal_path):
+            return data
+
+        replayed = 0
+        valid_bytes = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning(f"Dropping a torn record at byte {valid_bytes} of {self.journal_path}")
+                    break
+                data[record["filename"]] = record["analysis"]
+                valid_bytes += len(line)
+                replayed += 1
+        if valid_bytes < os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, valid_bytes)  # so new records start on a clean line
+        self._journal_bytes = valid_bytes
+        if replayed:
+            logging.info(f"Replayed {replayed} analyses from {self.journal_path}")
+        return data
+
+    def append(self, analyses: Dict[str, Dict]) -> bool:
+        """Journal `analyses`. Returns True when the journal should be compacted."""
+        lines = "".join(
+            json.dumps({"filename": filename, "analysis": analysis}) + "\n" for filename, analysis in analyses.items()
+        ).encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journal_path, "ab")
+            self._file.write(lines)
+            self._file.flush()
+            self._journal_bytes += len(lines)
+            self._unsynced = True
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+            return self._journal_bytes > max(self.compact_min_bytes, self._snapshot_bytes)
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def compact(self, analyses: Dict[str, Dict]):
+        """Replace the snapshot with `analyses` (everything loaded and appended) and empty the journal."""
+        with self._lock:
+            if self._journal_bytes == 0 and os.path.exists(self.snapshot_path):
+                return
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(analyses, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # A crash before the journal is emptied only replays records the snapshot already has
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.journal_path):
+                os.truncate(self.journal_path, 0)
+            self._snapshot_bytes = os.path.getsize(self.snapshot_path)
+            self._journal_bytes = 0
+            self._unsynced = False
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _sync(self):
+        if self._unsynced and self._file is not None:
+            os.fsync(self._file.fileno())
+        self._unsynced = False
+        self._last_sync = time.monotonic()
@@ -0,0 +1,205 @@
+import bisect
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional, only needed for condensing
+    np = None
+
+from .backend import Config
+from .streaming import TIMED_SECTIONS
+from .timestamps import format_timestamp, parse_timestamp
+
+
+@dataclass
+class TimestampMap:
+    """Maps times in a condensed clip back to the original video.
+
+    `spans` holds (condensed start, original start, length) for every kept
+    segment, in order.
+    """
+    spans: List[Tuple[float, float, float]] = field(default_factory=list)
+
+    def to_original(self, seconds: float) -> float:
+        starts = [span[0] for span in self.spans]
+        i = max(0, bisect.bisect_right(starts, seconds) - 1)
+        condensed_start, original_start, length = self.spans[i]
+        return original_start + min(max(seconds - condensed_start, 0), length)
+
+    def remap_analysis(self, analysis: Dict) -> Dict:
+        """Rewrite every timestamp in an analysis of the condensed clip to point into the original video."""
+        def original(timestamp: str) -> str:
+            return format_timestamp(self.to_original(parse_timestamp(timestamp)))
+
+        remapped = dict(analysis)
+        for section in TIMED_SECTIONS:
+            remapped[section] = [
+                {**entry, "timestamp": original(entry["timestamp"])} for entry in analysis.get(section, [])
+            ]
+        remapped["repeated_errors"] = [
+            {**error, "occurrences": [original(t) for t in error.get("occurrences", [])]}
+            for error in analysis.get("repeated_errors", [])
+        ]
+        return remapped
+
+
+@dataclass
+class CondensedVideo:
+    path: str
+    timestamp_map: TimestampMap
+    original_seconds: float
+    condensed_seconds: float
+    original_bytes: int
+    condensed_bytes: int
+
+    @property
+    def seconds_saved(self) -> float:
+        return self.original_seconds - self.condensed_seconds
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.condensed_bytes
+
+
+def _require_tools():
+    if np is None:
+        raise RuntimeError("numpy is required to condense videos (pip install numpy)")
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required to condense videos but was not found on PATH")
+
+
+def sample_frames(path: str, fps: float, width: int = 64, height: int = 36) -> "np.ndarray":
+    """Decode `path` at `fps` into an (frames, height, width) array of small grayscale frames."""
+    raw = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", path, "-an",
+         "-vf", f"fps={fps},scale={width}:{height},format=gray",
+         "-f", "rawvideo", "-"],
+        capture_output=True, check=True,
+    ).stdout
+    return np.frombuffer(raw, dtype=np.uint8).reshape(-1, height, width)
+
+
+def frame_differences(frames: "np.ndarray") -> "np.ndarray":
+    """Mean absolute pixel change between each frame and the one before it (0-255)."""
+    if len(frames) < 2:
+        return np.zeros(0)
+    return np.abs(np.diff(frames.astype(np.int16), axis=0)).mean(axis=(1, 2))
+
+
+def active_segments(differences: "np.ndarray", fps: float, threshold: float,
+                    min_static: float, padding: float) -> List[Tuple[float, float]]:
+    """Segments (start, end) in seconds to keep.
+
+    A run of frames changing less than `threshold` for at least `min_static`
+    seconds (paused menus, frozen frames, duplicated stills) is dropped;
+    everything else is kept with `padding` seconds either side.
+    """
+    duration = (len(differences) + 1) / fps
+    static = np.concatenate(([False], differences < threshold))
+    # Start/end indexes of every run of static frames
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], static.astype(np.int8), [0]))))
+    runs = edges.reshape(-1, 2)
+    long_runs = runs[(runs[:, 1] - runs[:, 0]) / fps >= min_static]
+
+    segments = []
+    position = 0.0
+    for start, end in long_runs / fps:
+        cut_start, cut_end = start + padding, end - padding
+        if cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            segments.append((position, cut_start))
+        position = cut_end
+    if position < duration:
+        segments.append((position, duration))
+    return [(float(start), float(end)) for start, end in segments]
+
+
+def has_audio(path: str) -> bool:
+    """Whether `path` has an audio stream, from ffmpeg's header dump."""
+    stderr = subprocess.run(["ffmpeg", "-hide_banner", "-i", path], capture_output=True, text=True).stderr
+    return re.search(r"Stream #\S+.*: Audio:", stderr) is not None
+
+
+def write_condensed(path: str, segments: List[Tuple[float, float]], out_path: str):
+    """Re-encode only `segments` of `path` into `out_path`."""
+    keep = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in segments)
+    # An audio filter on a video without audio makes ffmpeg fail
+    audio = ["-af", f"aselect='{keep}',asetpts=N/SR/TB"] if has_audio(path) else ["-an"]
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", path,
+         "-vf", f"select='{keep}',setpts=N/FRAME_RATE/TB", *audio,
+         "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", out_path],
+        check=True,
+    )
+
+
+class KeyframeCondenser:
+    """Optional pre-processing before upload that cuts static stretches out of a video.
+
+    Frames are sampled at CONDENSE_FPS and compared with NumPy; long runs
+    without visible change are removed and the rest is re-encoded into a
+    shorter clip. The returned CondensedVideo carries the timestamp map
+    needed to point the analysis back at the original video. Condensed
+    clips stay in `out_dir` until they are handed to `remove`, once their
+    upload is ACTIVE. `condense` may be called from several threads.
+    """
+
+    def __init__(self, config: Config, out_dir: str):
+        self.config = config
+        self.out_dir = out_dir
+        self.seconds_saved = 0.0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        os.makedirs(out_dir, exist_ok=True)
+
+    def condense(self, path: str) -> Optional[CondensedVideo]:
+        """Condensed copy of `path`, or None when too little would be removed to be worth uploading it."""
+        _require_tools()
+        fps = self.config.CONDENSE_FPS
+        differences = frame_differences(sample_frames(path, fps))
+        duration = (len(differences) + 1) / fps
+        segments = active_segments(differences, fps, self.config.SCENE_CHANGE_THRESHOLD,
+                                   self.config.MIN_STATIC_SECONDS, self.config.CONDENSE_PADDING)
+        kept = sum(end - start for start, end in segments)
+        if not segments or duration - kept < self.config.MIN_SECONDS_SAVED:
+            logging.info(f"Not condensing {path}: only {duration - kept:.0f}s is static")
+            return None
+
+        out_path = os.path.join(self.out_dir, os.path.basename(path))
+        write_condensed(path, segments, out_path)
+
+        spans, position = [], 0.0
+        for start, end in segments:
+            spans.append((position, start, end - start))
+            position += end - start
+        condensed = CondensedVideo(
+            path=out_path,
+            timestamp_map=TimestampMap(spans),
+            original_seconds=duration,
+            condensed_seconds=kept,
+            original_bytes=os.path.getsize(path),
+            condensed_bytes=os.path.getsize(out_path),
+        )
+        with self._lock:
+            self.seconds_saved += condensed.seconds_saved
+            self.bytes_saved += condensed.bytes_saved
+        logging.info(
+            f"Condensed {path}: {condensed.seconds_saved:.0f}s and "
+            f"{condensed.bytes_saved / 1e6:.1f}MB saved ({len(segments)} segments kept)"
+        )
+        return condensed
+
+    def remove(self, path: str):
+        """Delete a condensed clip that is no longer needed."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
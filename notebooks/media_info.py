@@ -0,0 +1,86 @@
+import os
+import struct
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+
+ASSUMED_BYTES_PER_SECOND = 500_000  # ~4 Mbit/s, for files whose container cannot be read
+
+
+@dataclass
+class VideoInfo:
+    duration: float  # seconds
+    width: int = 0
+    height: int = 0
+
+
+def _boxes(f, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload start, payload end) for each ISO-BMFF box between `start` and `end`."""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return
+        yield box_type, position + header_size, min(position + size, end)
+        position += size
+
+
+def probe_mp4(path: str) -> Optional[VideoInfo]:
+    """Duration and frame size of an MP4/MOV file from its moov box, without decoding.
+
+    Only box headers plus the mvhd and tkhd payloads are read, so this costs a
+    few small reads even for multi-GB files. Returns None for other
+    containers and for files whose header does not give a duration.
+    """
+    try:
+        with open(path, "rb") as f:
+            end = os.fstat(f.fileno()).st_size
+            for box_type, start, stop in _boxes(f, 0, end):
+                if box_type == b"moov":
+                    return _read_moov(f, start, stop)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def _read_moov(f, start: int, end: int) -> Optional[VideoInfo]:
+    duration = None
+    width = height = 0
+    for box_type, box_start, box_end in _boxes(f, start, end):
+        if box_type == b"mvhd":
+            f.seek(box_start)
+            version = f.read(4)[0]
+            if version == 1:
+                f.seek(box_start + 20)
+                timescale, length = struct.unpack(">IQ", f.read(12))
+            else:
+                f.seek(box_start + 12)
+                timescale, length = struct.unpack(">II", f.read(8))
+            if timescale and length:
+                duration = length / timescale
+        elif box_type == b"trak":
+            for track_box, track_start, track_end in _boxes(f, box_start, box_end):
+                if track_box == b"tkhd" and track_end - track_start >= 84:
+                    # Width and height close the box as 16.16 fixed point; audio tracks have 0
+                    f.seek(track_end - 8)
+                    track_width, track_height = struct.unpack(">II", f.read(8))
+                    width, height = max(width, track_width >> 16), max(height, track_height >> 16)
+    return VideoInfo(duration, width, height) if duration is not None else None
+
+
+def estimate_video_seconds(path: str) -> float:
+    """Video length from the container when it is cheap to read, otherwise guessed from the file size."""
+    info = probe_mp4(path)
+    if info is not None:
+        return info.duration
+    try:
+        return os.path.getsize(path) / ASSUMED_BYTES_PER_SECOND
+    except OSError:
+        return 0.0
@@ -0,0 +1,131 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+METRIC_HELP = {
+    "video_stage_seconds": ("histogram", "Time spent in each stage of analyzing a video"),
+    "gemini_tokens_total": ("counter", "Tokens reported in Gemini usage metadata"),
+    "http_request_duration_seconds": ("histogram", "Flask request latency by route"),
+}
+_NO_SPAN = nullcontext()
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters, latency histograms and gauges, rendered in the Prometheus text format.
+
+    `span(stage)` times a block into `video_stage_seconds`, labelled with
+    the outcome. With `enabled` set to False, `span` returns a shared no-op
+    context manager and the other methods return at once, so the
+    instrumentation costs an attribute check per call.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], Dict[str, float]]]] = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def span(self, stage: str, **labels):
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(stage, labels)
+
+    @contextmanager
+    def _span(self, stage: str, labels: Dict):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            self.observe("video_stage_seconds", time.perf_counter() - start, stage=stage, status=status, **labels)
+
+    def record_usage(self, model_name: str, usage):
+        """Count the tokens in a response's `usage_metadata`."""
+        if not self.enabled or usage is None:
+            return
+        for kind in ("prompt", "candidates", "total"):
+            count = getattr(usage, f"{kind}_token_count", 0)
+            if count:
+                self.inc("gemini_tokens_total", count, model=model_name, kind=kind)
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], Dict[str, float]]):
+        """Report `read()` as gauges `<name>_<key>` on every render."""
+        with self._lock:
+            self._gauges.append((name, help_text, read))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += self._header(name)
+                lines += [f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                lines += self._header(name)
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            gauges = list(self._gauges)
+        for name, help_text, read in gauges:
+            for key, value in read().items():
+                lines += [f"# HELP {name}_{key} {help_text}", f"# TYPE {name}_{key} gauge", f"{name}_{key} {value:g}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _header(name: str) -> List[str]:
+        kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+        return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+metrics = Metrics()  # shared by the notebook helpers and the Flask app; set `metrics.enabled = False` to switch off
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .backend import AnalysisService, PromptGenerator, VideoManager, select_new_videos
+from .media_info import estimate_video_seconds
+from .resilience import poll_delay
+
+_DONE = object()  # end-of-stream marker passed between stages
+
+
+@dataclass
+class PipelineLimits:
+    """Per-stage concurrency, queue sizes and Gemini quotas for VideoPipeline."""
+    upload: int = 4
+    activate: int = 8
+    infer: int = 2
+    parse: int = 2
+    persist: int = 1
+    queue_size: int = 8
+    requests_per_minute: int = 15
+    tokens_per_minute: int = 1_000_000
+
+
+@dataclass
+class VideoJob:
+    path: str
+    filename: str
+    cache_key: Optional[str] = None
+    video_file: object = None
+    response_text: Optional[str] = None
+    analysis: Optional[Dict] = None
+    estimated_tokens: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class TokenBucket:
+    """Async token bucket holding up to `capacity` tokens, refilled at `per_minute` / 60 per second."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1):
+        # Requests larger than the bucket would never fit; let them drain it instead
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class RateLimiter:
+    """Shared request and token quota for every inference call in a pipeline."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+def estimate_tokens(path: str, prompt: str, tokens_per_second: int = 300) -> int:
+    """Rough input size of a request: the prompt plus ~300 tokens per second of video.
+
+    The duration comes from the MP4 header, or is guessed from the file size for other containers.
+    """
+    return len(prompt) // 4 + int(estimate_video_seconds(path) * tokens_per_second)
+
+
+class VideoPipeline:
+    """Staged asyncio version of backend.process_videos.
+
+    scan -> upload -> activate -> infer -> parse -> persist, joined by bounded
+    queues. Every stage has its own number of workers, so videos move through
+    independently: a slow inference holds one infer worker while uploads and
+    activations for the rest of the batch continue. Inference calls share a
+    RateLimiter that keeps the pipeline under the Gemini RPM/TPM quotas.
+    Blocking SDK calls run in worker threads.
+    """
+
+    def __init__(self, video_manager: VideoManager, analysis_service: AnalysisService, game_name: str,
+                 limits: Optional[PipelineLimits] = None, limiter: Optional[RateLimiter] = None,
+                 cache=None, token_estimator: Callable[[str, str], int] = estimate_tokens):
+        self.video_manager = video_manager
+        self.analysis_service = analysis_service
+        self.config = video_manager.config
+        self.limits = limits or PipelineLimits()
+        self.limiter = limiter or RateLimiter(self.limits.requests_per_minute, self.limits.tokens_per_minute)
+        self.cache = cache
+        self.token_estimator = token_estimator
+        self.prompt = PromptGenerator.create_game_prompt(game_name, include_example=not analysis_service.structured)
+        self.duplicates: Dict[str, List[str]] = {}
+        self.completed: List[str] = []
+        self.failed: Dict[str, str] = {}
+
+    async def run(self) -> Dict:
+        """Process every new video and return a summary of the run."""
+        start = time.monotonic()
+        queues = [asyncio.Queue(maxsize=self.limits.queue_size) for _ in range(5)]
+        stages = [
+            ("upload", self._upload, self.limits.upload),
+            ("activate", self._activate, self.limits.activate),
+            ("infer", self._infer, self.limits.infer),
+            ("parse", self._parse, self.limits.parse),
+            ("persist", self._persist, self.limits.persist),
+        ]
+        tasks = [asyncio.create_task(self._scan(queues[0]))]
+        for i, (name, handler, workers) in enumerate(stages):
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            tasks.append(asyncio.create_task(self._stage(name, handler, workers, queues[i], outbox)))
+        await asyncio.gather(*tasks)
+
+        self.video_manager.compact()
+        if self.cache is not None:
+            self.cache.save()
+        summary = {
+            "completed": len(self.completed),
+            "failed": self.failed,
+            "elapsed": time.monotonic() - start,
+        }
+        logging.info(f"Pipeline finished: {summary}")
+        return summary
+
+    async def _scan(self, outbox: asyncio.Queue):
+        videos, self.duplicates = await asyncio.to_thread(
+            select_new_videos, self.video_manager, self.prompt, self.analysis_service.model_name, self.cache
+        )
+        logging.info(f"Processing {len(videos)} new videos.")
+        videos.sort(key=lambda video: estimate_video_seconds(video[0]))  # shortest first
+        for path, filename, cache_key in videos:
+            await outbox.put(VideoJob(path, filename, cache_key))
+        await outbox.put(_DONE)
+
+    async def _stage(self, name: str, handler, workers: int, inbox: asyncio.Queue,
+                     outbox: Optional[asyncio.Queue]):
+        async def worker():
+            while True:
+                job = await inbox.get()
+                if job is _DONE:
+                    # Let the other workers of this stage see the marker too
+                    await inbox.put(_DONE)
+                    return
+                started = time.monotonic()
+                try:
+                    await handler(job)
+                except Exception as e:
+                    logging.error(f"{name} failed for {job.filename}: {e}")
+                    self.failed[job.filename] = f"{name}: {e}"
+                    continue
+                job.timings[name] = time.monotonic() - started
+                if outbox is not None:
+                    await outbox.put(job)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if outbox is not None:
+            await outbox.put(_DONE)
+
+    async def _upload(self, job: VideoJob):
+        logging.info(f"Uploading {job.path}...")
+        job.video_file = await asyncio.to_thread(self.video_manager.client.upload_file, path=job.path)
+
+    async def _activate(self, job: VideoJob):
+        deadline = time.monotonic() + self.config.MAX_WAIT_TIME
+        attempt = 0
+        while True:
+            state = (await asyncio.to_thread(self.video_manager.client.get_file, job.video_file.name)).state.name
+            if state == "ACTIVE":
+                return
+            if state == "FAILED" or time.monotonic() >= deadline:
+                raise TimeoutError(f"file did not become ACTIVE within {self.config.MAX_WAIT_TIME}s")
+            await asyncio.sleep(poll_delay(attempt, self.config.POLL_INITIAL_INTERVAL, self.config.WAIT_INTERVAL))
+            attempt += 1
+
+    async def _infer(self, job: VideoJob):
+        job.estimated_tokens = self.token_estimator(job.path, self.prompt)
+        await self.limiter.acquire(job.estimated_tokens)
+        job.response_text = await asyncio.to_thread(self.analysis_service.analyze_video, job.video_file, self.prompt)
+
+    async def _parse(self, job: VideoJob):
+        job.analysis = self.analysis_service.decode(job.response_text)
+
+    async def _persist(self, job: VideoJob):
+        filenames = [job.filename]
+        if job.cache_key is not None:
+            self.cache.put(job.cache_key, job.analysis)
+            filenames += self.duplicates.get(job.cache_key, [])
+        await asyncio.to_thread(self.video_manager.save_analyses, {filename: job.analysis for filename in filenames})
+        self.completed.append(job.filename)
+        logging.info(f"Stored analysis for {job.filename} ({job.timings})")
+
+
+def process_videos_async(video_manager: VideoManager, analysis_service: AnalysisService, game_name: str,
+                         limits: Optional[PipelineLimits] = None, cache=None) -> Dict:
+    """Run VideoPipeline to completion. Inside a running event loop (e.g. Jupyter), `await pipeline.run()` instead."""
+    pipeline = VideoPipeline(video_manager, analysis_service, game_name, limits=limits, cache=cache)
+    return asyncio.run(pipeline.run())
@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from google.generativeai import protos
+from google.generativeai.types import file_types
+
+from .backend import VideoManager
+from .cache import FileHashes
+
+
+class RemoteFileManifest:
+    """Local record of the videos already uploaded to Gemini, keyed by content hash.
+
+    Replaces listing every remote file to find earlier uploads: a lookup is a
+    dictionary access plus a cached content hash, and the remote API is only
+    asked about a file when it is within `refresh_margin` seconds of its
+    expiry (uploads are deleted by Gemini after about 48 hours).
+
+    Uploads whose analysis has been stored are handed to `release`, and a
+    background thread deletes them so the project stays under its file
+    storage quota. Pending deletions are saved with the manifest, so they
+    are picked up again after a restart. Files that cannot be deleted are
+    left to expire.
+
+    Every change is appended to `<path>.journal` as one JSON line instead of
+    rewriting the manifest. The journal is folded into the manifest at
+    startup and once it outgrows both the manifest and `compact_min_bytes`.
+    Losing the last lines in a crash only costs a re-upload, or a file left
+    to expire. Pass the `hashes` of an AnalysisCache to hash each video
+    once for both.
+    """
+
+    def __init__(self, video_manager: VideoManager, path: Optional[str] = None, hashes: Optional[FileHashes] = None,
+                 compact_min_bytes: int = 64 * 1024):
+        config = video_manager.config
+        self.client = video_manager.client
+        self.path = path or config.REMOTE_FILES_MANIFEST
+        self.journal_path = self.path + ".journal"
+        self.refresh_margin = config.REMOTE_FILE_REFRESH_MARGIN
+        self.default_ttl = config.REMOTE_FILE_TTL
+        self.compact_min_bytes = compact_min_bytes
+        self.hashes = hashes or FileHashes()
+        self._entries: Dict[str, Dict] = {}  # content hash -> remote file
+        self._by_name: Dict[str, str] = {}  # remote file name -> content hash
+        self._garbage: List[str] = []  # remote file names to delete
+        self._journal = None
+        self._snapshot_bytes = 0
+        self._journal_bytes = 0
+        self._lock = threading.Condition()
+        self._collector = None
+        self._closed = False
+        self._load()
+        if self._garbage:
+            self._start_collector()
+
+    def content_hash(self, path: str) -> str:
+        return self.hashes.content_hash(path)
+
+    def get(self, path: str) -> Optional[file_types.File]:
+        """The uploaded copy of the video at `path`, or None if it has to be uploaded."""
+        content_hash = self.content_hash(path)
+        with self._lock:
+            entry = self._entries.get(content_hash)
+        if entry is None:
+            return None
+        if entry["expires_at"] - time.time() > self.refresh_margin:
+            return self._to_file(entry)
+
+        try:
+            video_file = self.client.get_file(entry["name"])
+        except Exception as e:
+            logging.info(f"Forgetting remote file {entry['name']}: {e}")
+            video_file = None
+        if video_file is not None and video_file.state.name == "ACTIVE":
+            entry = self._entry(video_file, entry["display_name"])
+            if entry["expires_at"] - time.time() > self.refresh_margin:
+                with self._lock:
+                    self._change({"op": "put", "hash": content_hash, "entry": entry})
+                return self._to_file(entry)
+        with self._lock:
+            self._change({"op": "forget", "hash": content_hash})
+        return None
+
+    def record(self, path: str, video_file):
+        """Remember that `video_file` is the ACTIVE upload of the video at `path`."""
+        content_hash = self.content_hash(path)
+        change = {"op": "put", "hash": content_hash, "entry": self._entry(video_file, os.path.basename(path))}
+        known = self.hashes.known(path)
+        if known is not None:
+            change["file"] = [os.path.abspath(path), known]  # so a restart does not hash it again
+        with self._lock:
+            self._change(change)
+
+    def release(self, name: str):
+        """Forget the remote file `name` and delete it in the background."""
+        with self._lock:
+            self._change({"op": "release", "name": name})
+            self._lock.notify_all()
+        self._start_collector()
+
+    def collect(self) -> int:
+        """Delete every released remote file now. Returns how many were deleted."""
+        deleted = 0
+        while True:
+            with self._lock:
+                if not self._garbage:
+                    return deleted
+                name = self._garbage.pop(0)
+            try:
+                self.client.delete_file(name)
+                deleted += 1
+                logging.info(f"Deleted remote file {name}")
+            except Exception as e:
+                logging.warning(f"Could not delete remote file {name}, leaving it to expire: {e}")
+            with self._lock:
+                self._change({"op": "collected", "name": name})
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop the background collector after it has deleted the pending files."""
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+            collector = self._collector
+        if collector is not None:
+            collector.join(timeout)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _start_collector(self):
+        with self._lock:
+            if self._collector is not None or self._closed:
+                return
+            self._collector = threading.Thread(target=self._collect_forever, daemon=True)
+            self._collector.start()
+
+    def _collect_forever(self):
+        while True:
+            with self._lock:
+                while not self._garbage and not self._closed:
+                    self._lock.wait()
+                if not self._garbage:
+                    return
+            self.collect()
+
+    def _entry(self, video_file, display_name: str) -> Dict:
+        expiration = getattr(video_file, "expiration_time", None)
+        expires_at = expiration.timestamp() if expiration is not None else 0
+        if expires_at <= 0:  # not reported, assume the documented lifetime
+            expires_at = time.time() + self.default_ttl
+        return {
+            "name": video_file.name,
+            "uri": video_file.uri,
+            "mime_type": video_file.mime_type,
+            "display_name": display_name,
+            "expires_at": expires_at,
+        }
+
+    @staticmethod
+    def _to_file(entry: Dict) -> file_types.File:
+        return file_types.File(protos.File(
+            name=entry["name"], uri=entry["uri"], mime_type=entry["mime_type"],
+            display_name=entry["display_name"], state=protos.File.State.ACTIVE,
+        ))
+
+    def _apply(self, change: Dict):
+        # Called with the lock held, for new changes and when replaying the journal
+        op = change["op"]
+        if op == "put":
+            previous = self._entries.get(change["hash"])
+            if previous is not None:
+                self._by_name.pop(previous["name"], None)
+            self._entries[change["hash"]] = change["entry"]
+            self._by_name[change["entry"]["name"]] = change["hash"]
+            if "file" in change:
+                path, known = change["file"]
+                self.hashes.update({path: known})
+        elif op == "forget":
+            entry = self._entries.pop(change["hash"], None)
+            if entry is not None:
+                self._by_name.pop(entry["name"], None)
+        elif op == "release":
+            content_hash = self._by_name.pop(change["name"], None)
+            if content_hash is not None:
+                del self._entries[content_hash]
+            if change["name"] not in self._garbage:
+                self._garbage.append(change["name"])
+        elif op == "collected":
+            if change["name"] in self._garbage:
+                self._garbage.remove(change["name"])
+
+    def _change(self, change: Dict):
+        # Called with the lock held
+        self._apply(change)
+        line = (json.dumps(change) + "\n").encode("utf-8")
+        if self._journal is None:
+            self._journal = open(self.journal_path, "ab")
+        self._journal.write(line)
+        self._journal.flush()
+        self._journal_bytes += len(line)
+        if self._journal_bytes > max(self.compact_min_bytes, self._snapshot_bytes):
+            self._compact()
+
+    def _compact(self):
+        # Called with the lock held
+        data = {"files": self._entries, "garbage": self._garbage, "hashes": self.hashes.to_dict()}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        # A crash before the journal is emptied only replays changes the manifest already has
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.truncate(self.journal_path, 0)
+        self._snapshot_bytes = os.path.getsize(self.path)
+        self._journal_bytes = 0
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Ignoring unreadable remote file manifest {self.path}: {e}")
+                data = {}
+            self._entries = data.get("files", {})
+            self._by_name = {entry["name"]: content_hash for content_hash, entry in self._entries.items()}
+            self._garbage = data.get("garbage", [])
+            self.hashes.update(data.get("hashes", {}))
+            self._snapshot_bytes = os.path.getsize(self.path)
+
+        if os.path.exists(self.journal_path):
+            valid_bytes = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete line")
+                        change = json.loads(line)
+                    except ValueError:
+                        logging.warning(f"Dropping a torn record at byte {valid_bytes} of {self.journal_path}")
+                        break
+                    self._apply(change)
+                    valid_bytes += len(line)
+            self._journal_bytes = valid_bytes
+
+        now = time.time()
+        expired = [content_hash for content_hash, entry in self._entries.items() if entry["expires_at"] <= now]
+        for content_hash in expired:
+            self._by_name.pop(self._entries.pop(content_hash)["name"], None)
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0:
+            self._compact()  # also drops a torn last line
@@ -0,0 +1,198 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def poll_delay(attempt: int, initial: float, maximum: float) -> float:
+    """Exponential backoff with jitter: half the capped delay plus a random share of the rest."""
+    delay = min(maximum, initial * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, dropped connections, rate limits and 5xx responses are worth retrying; bad requests are not."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)  # HTTP status of google.api_core exceptions
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+class CircuitOpenError(RuntimeError):
+    """The model failed too often recently, so requests to it are refused for a while."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive retryable failures.
+
+    While open, requests are refused without contacting the model. After
+    `reset_timeout` seconds a single trial request is let through; it
+    closes the circuit if it succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record(self, success: bool):
+        with self._lock:
+            self._trial = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class InferencePolicy:
+    """Retries, hedging, circuit breaking and model fallback for generate_content calls.
+
+    Retryable errors (see is_retryable) are retried up to `attempts` times
+    with exponential backoff and jitter; other errors are raised at once.
+    Once `hedge_min_samples` latencies are known for a model, a request that
+    takes longer than the `hedge_percentile` latency gets a duplicate and
+    whichever answers first wins. Each model has a CircuitBreaker, and when
+    the primary model's circuit is open or its attempts are used up, the
+    request goes to `fallback_model` instead.
+
+    Breakers and latencies are kept per policy, so share one policy between
+    the AnalysisService instances that call the same models.
+    """
+
+    def __init__(self, attempts: int = 3, initial_backoff: float = 2.0, max_backoff: float = 30.0,
+                 timeout: float = 600, hedge_percentile: Optional[float] = None, hedge_min_samples: int = 20,
+                 fallback_model: Optional[str] = None, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.attempts = attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.fallback_model = fallback_model
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedged = 0
+        self.hedges_won = 0
+        self.fallbacks = 0
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model_name: str) -> CircuitBreaker:
+        with self._lock:
+            if model_name not in self._breakers:
+                self._breakers[model_name] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[model_name]
+
+    def latency_percentile(self, model_name: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies.get(model_name, ()))
+        if len(latencies) < self.hedge_min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def run(self, call: Callable[[str, float], Any], model_name: str, hedge: bool = True,
+            can_retry: Optional[Callable[[], bool]] = None):
+        """Return `call(model_name, timeout)`, retrying, hedging and falling back as configured.
+
+        `can_retry()` is checked before every retry; streaming calls use it
+        to stop retrying once part of the response has been handed out.
+        """
+        models = [model_name]
+        if self.fallback_model and self.fallback_model != model_name:
+            models.append(self.fallback_model)
+        error = None
+        for model in models:
+            if model != model_name:
+                if can_retry is not None and not can_retry():
+                    break
+                logging.warning(f"Falling back to {model} after {model_name} failed: {error}")
+                with self._lock:
+                    self.fallbacks += 1
+            breaker = self.breaker(model)
+            for attempt in range(self.attempts):
+                if attempt and can_retry is not None and not can_retry():
+                    raise error
+                if not breaker.allow():
+                    error = CircuitOpenError(f"Too many recent failures from {model}, not sending more requests")
+                    break
+                start = time.monotonic()
+                try:
+                    result = self._hedged(call, model) if hedge else call(model, self.timeout)
+                except Exception as e:
+                    if not is_retryable(e):
+                        breaker.record(success=True)  # the model answered, the request was at fault
+                        raise
+                    breaker.record(success=False)
+                    error = e
+                    if attempt + 1 < self.attempts:
+                        delay = poll_delay(attempt, self.initial_backoff, self.max_backoff)
+                        logging.warning(f"Request to {model} failed ({e}), retrying in {delay:.1f}s")
+                        time.sleep(delay)
+                    continue
+                breaker.record(success=True)
+                with self._lock:
+                    self._latencies.setdefault(model, deque(maxlen=200)).append(time.monotonic() - start)
+                return result
+        if error is None:  # attempts < 1, so nothing was sent
+            raise RuntimeError(f"No request was sent to {model_name}: attempts is {self.attempts}")
+        raise error
+
+    def _hedged(self, call: Callable[[str, float], Any], model: str):
+        threshold = self.latency_percentile(model, self.hedge_percentile) if self.hedge_percentile else None
+        if threshold is None:
+            return call(model, self.timeout)
+        # The losing request cannot be cancelled; it finishes in the background
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            first = pool.submit(call, model, self.timeout)
+            done, _ = wait([first], timeout=threshold)
+            if done:
+                return first.result()
+            logging.info(f"Request to {model} slower than {threshold:.1f}s, sending a hedged duplicate")
+            second = pool.submit(call, model, self.timeout)
+            with self._lock:
+                self.hedged += 1
+            pending = {first, second}
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is second:
+                            with self._lock:
+                                self.hedges_won += 1
+                        return future.result()
+                if not pending:
+                    return first.result()  # both failed
+        finally:
+            pool.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hedged": self.hedged,
+                "hedges_won": self.hedges_won,
+                "fallbacks": self.fallbacks,
+                "open_circuits": [model for model, breaker in self._breakers.items() if breaker.opened_at is not None],
+            }
@@ -1,8 +1,10 @@
 import os
 import time
 import json
+import random
 import re
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
 
 # Configure logging
@@ -15,14 +17,31 @@ genai.configure(api_key=API_KEY)
 
 # Set up paths
 video_dir = "/content/videos"
+upload_workers = 4  # uploads (and their activation waits) running at once
 processed_videos_log = "processed_videos.json"
+processed_videos_journal = processed_videos_log + ".journal"  # one JSON line per video analyzed since the last fold
+compact_min_bytes = 1024 * 1024  # fold the journal into the log only once it outgrows this and the log
 
-# Load previously processed videos
+# Load previously processed videos, then replay anything a crashed run only journaled
 if os.path.exists(processed_videos_log):
     with open(processed_videos_log, "r") as f:
         processed_videos = json.load(f)
 else:
     processed_videos = {}
+if os.path.exists(processed_videos_journal):
+    valid_bytes = 0
+    with open(processed_videos_journal, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("incomplete line")
+                record = json.loads(line)
+            except ValueError:
+                break  # torn last line
+            processed_videos[record["filename"]] = record["analysis"]
+            valid_bytes += len(line)
+    # Cut off a torn line, so the next append starts on a line of its own
+    os.truncate(processed_videos_journal, valid_bytes)
 
 # List available video files
 def list_video_files(directory):
@@ -46,27 +65,32 @@ def upload_video(file_path):
     video_file = genai.upload_file(path=file_path)
     logging.info(f"Uploaded: {video_file.uri}, waiting for activation...")
 
-    # Wait for file to be in ACTIVE state
+    # Wait for file to be in ACTIVE state, backing off exponentially (with jitter) up to 5s between checks
     max_wait_time = 120  # 2 minutes
-    wait_interval = 5
-    elapsed_time = 0
+    max_interval = 5
+    start = time.monotonic()
+    attempt = 0
 
-    while elapsed_time < max_wait_time:
+    while time.monotonic() - start < max_wait_time:
         video_status = genai.get_file(video_file.name)  # Check file status
-        if video_status.state == "ACTIVE":
+        if video_status.state.name == "ACTIVE":
             logging.info(f"File {file_path} is now ACTIVE.")
             return video_file
-        time.sleep(wait_interval)
-        elapsed_time += wait_interval
-        logging.info(f"Waiting... {elapsed_time}s elapsed")
+        if video_status.state.name == "FAILED":
+            break
+        delay = min(max_interval, 2 ** attempt)
+        time.sleep(delay / 2 + random.uniform(0, delay / 2))
+        attempt += 1
+        logging.info(f"Waiting... {time.monotonic() - start:.0f}s elapsed")
 
     logging.error(f"File {file_path} did not become ACTIVE within {max_wait_time}s.")
     return None
 
 # Generate LLM request
+model = genai.GenerativeModel(model_name="models/gemini-2.0-flash")  # built once, reused for every video
+
 def analyze_video(video_file, prompt):
     logging.info(f"Sending {video_file.display_name} for analysis...")
-    model = genai.GenerativeModel(model_name="models/gemini-2.0-flash")
     response = model.generate_content([prompt, video_file], request_options={"timeout": 600})
     return response.text
 
@@ -195,6 +219,7 @@ def dynamic_game_prompt_template(game_name: str, focus_on: str = None) -> str:
 # Main Processing
 uploaded_files = get_uploaded_files()
 new_videos = []
+to_upload = []
 
 for video_path in list_video_files(video_dir):
     filename = os.path.basename(video_path)
@@ -205,13 +230,22 @@ for video_path in list_video_files(video_dir):
 
     if filename in uploaded_files:
         logging.info(f"Video {filename} already uploaded, skipping upload.")
-        video_file = uploaded_files[filename]
+        new_videos.append((filename, uploaded_files[filename]))
     else:
-        video_file = upload_video(video_path)
-        if not video_file:
-            continue  # Skip failed uploads
+        to_upload.append(video_path)
+
+def try_upload(video_path):
+    try:
+        return upload_video(video_path)
+    except Exception as e:
+        logging.error(f"Upload of {video_path} failed: {e}")
+        return None
 
-    new_videos.append((filename, video_file))
+# Upload in parallel, so the batch waits about as long as its slowest activation
+with ThreadPoolExecutor(max_workers=upload_workers) as pool:
+    for video_path, video_file in zip(to_upload, pool.map(try_upload, to_upload)):
+        if video_file:  # Skip failed uploads
+            new_videos.append((os.path.basename(video_path), video_file))
 
 # Process new videos
 if not new_videos:
@@ -219,15 +253,28 @@ if not new_videos:
 else:
     logging.info(f"Processing {len(new_videos)} new videos.")
 
-    for filename, video_file in new_videos:
-        response_text = analyze_video(video_file, dynamic_game_prompt_template("EA FC 24"))
-        json_data = extract_json(response_text)
-
-        # Save formatted output
-        formatted_analysis = format_analysis(json_data)
-        logging.info(f"Analysis for {filename}:\n{formatted_analysis}")
-
-        # Mark video as processed
-        processed_videos[filename] = json_data
-        with open(processed_videos_log, "w") as f:
+    with open(processed_videos_journal, "a") as journal:
+        for filename, video_file in new_videos:
+            response_text = analyze_video(video_file, dynamic_game_prompt_template("EA FC 24"))
+            json_data = extract_json(response_text)
+
+            # Save formatted output
+            formatted_analysis = format_analysis(json_data)
+            logging.info(f"Analysis for {filename}:\n{formatted_analysis}")
+
+            # Mark video as processed: append to the journal instead of rewriting the whole log.
+            # Flushed per video; the fsync below covers the whole run.
+            processed_videos[filename] = json_data
+            journal.write(json.dumps({"filename": filename, "analysis": json_data}) + "\n")
+            journal.flush()
+        os.fsync(journal.fileno())
+
+    # Fold the journal into the log only once it outgrows the log, so each run writes O(new videos) bytes
+    log_bytes = os.path.getsize(processed_videos_log) if os.path.exists(processed_videos_log) else 0
+    if os.path.getsize(processed_videos_journal) > max(compact_min_bytes, log_bytes):
+        with open(processed_videos_log + ".tmp", "w") as f:
             json.dump(processed_videos, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(processed_videos_log + ".tmp", processed_videos_log)
+        os.remove(processed_videos_journal)
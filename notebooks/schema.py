@@ -0,0 +1,132 @@
+import re
+import threading
+from dataclasses import asdict, dataclass, field, fields, is_dataclass
+from typing import Any, Dict, List, Optional, get_args, get_origin
+
+
+TIMESTAMP_PATTERN = re.compile(r"^\d{1,2}(:\d{2}){1,2}$")
+TIMESTAMP = {"timestamp": True}  # field metadata: value(s) must be HH:MM:SS
+
+
+class AnalysisValidationError(ValueError):
+    """A model response does not match the analysis schema."""
+
+
+@dataclass
+class Mistake:
+    timestamp: str = field(metadata=TIMESTAMP)
+    description: str
+    why_incorrect: str
+    better_alternative: str
+    expected_benefit: str
+
+
+@dataclass
+class RepeatedError:
+    pattern: str
+    occurrences: List[str] = field(metadata=TIMESTAMP)
+    fix: str
+
+
+@dataclass
+class MissedOpportunity:
+    timestamp: str = field(metadata=TIMESTAMP)
+    missed_action: str
+    expected_outcome: str
+
+
+@dataclass
+class GameAnalysis:
+    game: str
+    key_focus_areas: List[str]
+    mistakes: List[Mistake]
+    repeated_errors: List[RepeatedError]
+    missed_opportunities: List[MissedOpportunity]
+
+    @classmethod
+    def from_dict(cls, data: Any, repairs: Optional[List[str]] = None) -> "GameAnalysis":
+        """Decode and validate `data`, raising AnalysisValidationError on the first problem.
+
+        With a `repairs` list, problems are fixed where possible instead:
+        missing text becomes "", missing lists become [], list items that
+        cannot be decoded are dropped. Each fix is described in `repairs`.
+        """
+        return _decode_object(cls, data, "analysis", repairs)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _decode_object(cls, data: Any, path: str, repairs: Optional[List[str]]):
+    if not isinstance(data, dict):
+        raise AnalysisValidationError(f"{path} is not an object")
+    values = {}
+    for item in fields(cls):
+        item_path = f"{path}.{item.name}"
+        if item.name in data:
+            values[item.name] = _decode_value(item.type, data[item.name], item_path, item.metadata, repairs)
+        elif repairs is not None:
+            values[item.name] = [] if get_origin(item.type) is list else ""
+            repairs.append(f"{item_path} was missing")
+        else:
+            raise AnalysisValidationError(f"{item_path} is missing")
+    return cls(**values)
+
+
+def _decode_value(kind, value: Any, path: str, metadata, repairs: Optional[List[str]]):
+    if get_origin(kind) is list:
+        if not isinstance(value, list):
+            raise AnalysisValidationError(f"{path} is not a list")
+        (item_kind,) = get_args(kind)
+        items = []
+        for i, item in enumerate(value):
+            try:
+                items.append(_decode_value(item_kind, item, f"{path}[{i}]", metadata, repairs))
+            except AnalysisValidationError as e:
+                if repairs is None:
+                    raise
+                repairs.append(f"dropped {path}[{i}]: {e}")
+        return items
+    if is_dataclass(kind):
+        return _decode_object(kind, value, path, repairs)
+    if not isinstance(value, kind):
+        raise AnalysisValidationError(f"{path} should be a {kind.__name__}")
+    if metadata.get("timestamp") and not TIMESTAMP_PATTERN.match(value):
+        raise AnalysisValidationError(f"{path} is not a HH:MM:SS timestamp")
+    return value
+
+
+def response_schema(cls) -> Dict:
+    """OpenAPI schema for a dataclass, for use as a Gemini `response_schema`."""
+    def schema_for(kind) -> Dict:
+        if get_origin(kind) is list:
+            return {"type": "array", "items": schema_for(get_args(kind)[0])}
+        if is_dataclass(kind):
+            return {
+                "type": "object",
+                "properties": {item.name: schema_for(item.type) for item in fields(kind)},
+                "required": [item.name for item in fields(kind)],
+            }
+        return {"type": "string"}
+    return schema_for(cls)
+
+
+ANALYSIS_SCHEMA = response_schema(GameAnalysis)
+
+
+@dataclass
+class DecodeStats:
+    """Outcome of decoding model responses: of all `responses`,
+    `validation_failures` did not match the schema as returned, and
+    `retries_avoided` of those were repaired locally instead of being sent
+    to the model again."""
+    responses: int = 0
+    validation_failures: int = 0
+    retries_avoided: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, failed: bool = False, repaired: bool = False):
+        with self._lock:
+            self.responses += 1
+            self.validation_failures += failed
+            self.retries_avoided += repaired
@@ -0,0 +1,223 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from .backend import AnalysisService, VideoManager
+from .media_info import probe_mp4
+from .streaming import TIMED_SECTIONS
+from .timestamps import format_timestamp, parse_timestamp
+
+
+class SegmentAnalysisError(Exception):
+    """Some windows still failed after their retries. `results` holds the windows that succeeded."""
+
+    def __init__(self, message: str, failed: List[Tuple[float, float]], results: Dict[float, Dict]):
+        super().__init__(message)
+        self.failed = failed
+        self.results = results
+
+
+def _require(tool: str) -> str:
+    path = shutil.which(tool)
+    if path is None:
+        raise RuntimeError(f"{tool} is required for video segmentation but was not found on PATH")
+    return path
+
+
+def probe_duration(path: str) -> float:
+    """Duration of a video in seconds, from its MP4 header, ffprobe, or ffmpeg's header dump."""
+    info = probe_mp4(path)
+    if info is not None:
+        return info.duration
+    if shutil.which("ffprobe"):
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        return float(output.strip())
+    stderr = subprocess.run([_require("ffmpeg"), "-i", path], capture_output=True, text=True).stderr
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", stderr)
+    if not match:
+        raise ValueError(f"Could not read the duration of {path}")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def plan_windows(duration: float, window: float, overlap: float) -> List[Tuple[float, float]]:
+    """Split [0, duration] into windows of `window` seconds that overlap by `overlap` seconds."""
+    if overlap >= window:
+        raise ValueError("Window overlap must be shorter than the window")
+    windows = []
+    start = 0.0
+    while True:
+        end = min(duration, start + window)
+        windows.append((start, end))
+        if end >= duration:
+            return windows
+        start = end - overlap
+
+
+def cut_window(path: str, start: float, end: float, out_dir: str) -> str:
+    """Copy [start, end) of `path` into a new file without re-encoding.
+
+    Stream copy starts the clip at the keyframe at or before `start`, so
+    shifted timestamps may be late by up to one keyframe interval.
+    """
+    name, ext = os.path.splitext(os.path.basename(path))
+    out_path = os.path.join(out_dir, f"{name}_{int(start)}-{int(end)}{ext}")
+    subprocess.run(
+        [_require("ffmpeg"), "-v", "error", "-y", "-ss", f"{start:.3f}", "-i", path,
+         "-t", f"{end - start:.3f}", "-c", "copy", "-avoid_negative_ts", "make_zero", out_path],
+        check=True,
+    )
+    return out_path
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def merge_window_analyses(results: List[Tuple[float, Dict]], overlap: float, tolerance: int = 5) -> Dict:
+    """Merge per-window analyses into one analysis of the full video.
+
+    `results` is a list of (window start in seconds, analysis) for every
+    window of plan_windows, which overlap by `overlap` seconds. Timestamps
+    are shifted by the window start. Two entries from adjacent windows that
+    both fall in their overlap region and land within `tolerance` seconds of
+    each other describe the same moment and are kept once; entries outside
+    the overlap are always kept. Repeated errors with the same pattern are
+    combined and their occurrences unioned the same way.
+    """
+    results = sorted(results, key=lambda item: item[0])
+    merged = {"game": "", "key_focus_areas": [], "mistakes": [], "repeated_errors": [], "missed_opportunities": []}
+    seen_areas = set()
+    patterns: Dict[str, Dict] = {}
+
+    def duplicate(window_index, seconds, others):
+        # Earlier windows are merged first, so only the previous window can share an overlap with this one
+        if window_index == 0:
+            return False
+        start = results[window_index][0]
+        if not start <= seconds <= start + overlap:
+            return False
+        return any(other_window == window_index - 1 and start <= other_seconds <= start + overlap
+                   and abs(other_seconds - seconds) <= tolerance
+                   for other_window, other_seconds in others)
+
+    for window_index, (offset, analysis) in enumerate(results):
+        merged["game"] = merged["game"] or analysis.get("game", "")
+        for area in analysis.get("key_focus_areas", []):
+            if _normalize(area) not in seen_areas:
+                seen_areas.add(_normalize(area))
+                merged["key_focus_areas"].append(area)
+
+        for section in TIMED_SECTIONS:
+            for entry in analysis.get(section, []):
+                seconds = parse_timestamp(entry["timestamp"]) + offset
+                if not duplicate(window_index, seconds, [(window, other) for window, other, _ in merged[section]]):
+                    merged[section].append((window_index, seconds, {**entry, "timestamp": format_timestamp(seconds)}))
+
+        for error in analysis.get("repeated_errors", []):
+            key = _normalize(error.get("pattern", ""))
+            combined = patterns.setdefault(key, {**error, "occurrences": []})
+            occurrences = combined["occurrences"]  # (window index, seconds)
+            for occurrence in error.get("occurrences", []):
+                seconds = parse_timestamp(occurrence) + offset
+                if (window_index, seconds) not in occurrences and not duplicate(window_index, seconds, occurrences):
+                    occurrences.append((window_index, seconds))
+
+    for section in TIMED_SECTIONS:
+        merged[section] = [entry for _, _, entry in sorted(merged[section], key=lambda item: item[1])]
+    for error in patterns.values():
+        occurrences = sorted(seconds for _, seconds in error["occurrences"])
+        error["occurrences"] = [format_timestamp(seconds) for seconds in occurrences]
+        merged["repeated_errors"].append(error)
+    return merged
+
+
+class SegmentedAnalyzer:
+    """Analyzes long videos as overlapping windows in parallel.
+
+    Each window is cut locally, uploaded and analyzed on its own, and retried
+    on its own when it fails, so one timeout costs a window instead of the
+    whole match. A retry reuses the window's upload unless the upload itself
+    failed. Results are merged with merge_window_analyses, after which the
+    window uploads are handed to `remote_files.release` (with a
+    RemoteFileManifest) or deleted.
+    """
+
+    def __init__(self, video_manager: VideoManager, analysis_service: AnalysisService, remote_files=None):
+        self.video_manager = video_manager
+        self.analysis_service = analysis_service
+        self.config = video_manager.config
+        self.remote_files = remote_files
+
+    def should_segment(self, path: str) -> bool:
+        try:
+            return probe_duration(path) > self.config.SEGMENT_MIN_DURATION
+        except (OSError, ValueError, RuntimeError, subprocess.CalledProcessError) as e:
+            logging.warning(f"Could not probe {path}, analyzing it whole: {e}")
+            return False
+
+    def analyze(self, path: str, prompt: str, done: Optional[Dict[float, Dict]] = None) -> Dict:
+        """Analyze `path` window by window. Windows already in `done` (start -> analysis) are skipped."""
+        windows = plan_windows(probe_duration(path), self.config.SEGMENT_SECONDS, self.config.SEGMENT_OVERLAP)
+        results = dict(done or {})
+        todo = [window for window in windows if window[0] not in results]
+        logging.info(f"Analyzing {path} as {len(windows)} windows ({len(todo)} to do)")
+
+        uploads = []  # every window upload, released once the windows are merged
+        try:
+            with tempfile.TemporaryDirectory() as out_dir:
+                with ThreadPoolExecutor(max_workers=self.config.SEGMENT_WORKERS) as pool:
+                    futures = {pool.submit(self._analyze_window, path, window, prompt, out_dir, uploads): window
+                               for window in todo}
+                    failed = []
+                    for future, window in futures.items():
+                        try:
+                            results[window[0]] = future.result()
+                        except Exception as e:
+                            logging.error(f"Window {window} of {path} failed: {e}")
+                            failed.append(window)
+
+            if failed:
+                raise SegmentAnalysisError(f"{len(failed)} of {len(windows)} windows failed for {path}", failed,
+                                           results)
+            return merge_window_analyses(list(results.items()), self.config.SEGMENT_OVERLAP)
+        finally:
+            # A resumed run cuts and uploads its windows again, so none of these are needed later
+            for video_file in uploads:
+                self._release(video_file)
+
+    def _analyze_window(self, path: str, window: Tuple[float, float], prompt: str, out_dir: str,
+                        uploads: List) -> Dict:
+        clip_path = cut_window(path, window[0], window[1], out_dir)
+        video_file = None
+        last_error = None
+        for attempt in range(self.config.SEGMENT_RETRIES + 1):
+            try:
+                if video_file is None:
+                    video_file = self.video_manager.upload_video(clip_path)
+                    if not video_file:
+                        raise RuntimeError("upload did not become ACTIVE")
+                    uploads.append(video_file)
+                response_text = self.analysis_service.analyze_video(video_file, prompt)
+                return self.analysis_service.decode(response_text)
+            except Exception as e:
+                last_error = e
+                logging.warning(f"Window {window} of {path} failed (attempt {attempt + 1}): {e}")
+        raise last_error
+
+    def _release(self, video_file):
+        if self.remote_files is not None:
+            self.remote_files.release(video_file.name)
+            return
+        try:
+            self.video_manager.client.delete_file(video_file.name)
+        except Exception as e:
+            logging.warning(f"Could not delete window upload {video_file.name}, leaving it to expire: {e}")
@@ -0,0 +1,130 @@
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+ANALYSIS_KEYS = ("game", "key_focus_areas", "mistakes", "repeated_errors", "missed_opportunities")
+TIMED_SECTIONS = ("mistakes", "missed_opportunities")
+LITERAL_CHARS = frozenset("-+.0123456789eEtrufalsn")  # numbers, true, false and null
+LITERAL = "0"  # stands for any literal character as the previous token
+
+
+class IncrementalAnalysisParser:
+    """Scans a streamed model response and reports list entries as soon as they close.
+
+    `feed` takes the next piece of text and returns (section, entry) for
+    every object in a top-level `mistakes` or `missed_opportunities` array
+    completed by it. Each character is scanned once; only finished entries
+    are handed to json.loads. Prose and stray braces around the JSON are
+    skipped: a candidate object is dropped as soon as a character cannot
+    continue a JSON object (e.g. the words after a brace in a sentence), or
+    once it closes and is not an analysis, and scanning resumes after its
+    opening brace.
+    """
+
+    def __init__(self, sections: Iterable[str] = TIMED_SECTIONS):
+        self.sections = set(sections)
+        self.text = ""
+        self.result: Optional[Dict] = None
+        self._reset(0)
+
+    def _reset(self, position: int):
+        self._pos = position
+        self._start = None  # index of the candidate top-level "{"
+        self._stack = []
+        self._prev = None  # last token outside strings: a structural character, '"' or LITERAL
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._entry_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict]]:
+        self.text += chunk
+        entries = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and self.result is None:
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._prev = '"'
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start:i + 1]
+            elif self._start is None:
+                if ch == "{":
+                    self._start = i
+                    self._stack.append(ch)
+                    self._prev = ch
+            elif ch in " \t\r\n":
+                pass
+            elif not self._fits(ch):
+                # Not JSON: the candidate started at a stray brace, not at the analysis
+                self._reset(self._start + 1)
+                i = self._pos
+                continue
+            elif ch in LITERAL_CHARS:
+                self._prev = LITERAL
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and len(self._stack) == 1:
+                try:
+                    self._key = json.loads(self._last_string) if self._last_string else None
+                except ValueError:
+                    self._key = None
+            elif ch in "{[":
+                self._stack.append(ch)
+                if ch == "{" and self._stack == ["{", "[", "{"] and self._key in self.sections:
+                    self._entry_start = i
+            elif ch in "}]":
+                self._stack.pop()
+                if len(self._stack) == 2 and ch == "}" and self._entry_start is not None:
+                    try:
+                        entries.append((self._key, json.loads(text[self._entry_start:i + 1])))
+                    except ValueError:
+                        pass
+                    self._entry_start = None
+                elif not self._stack:
+                    try:
+                        candidate = json.loads(text[self._start:i + 1])
+                    except ValueError:
+                        candidate = None
+                    if isinstance(candidate, dict) and any(key in candidate for key in ANALYSIS_KEYS):
+                        self.result = candidate
+                    else:
+                        self._reset(self._start + 1)
+                        i = self._pos
+                        continue
+            if ch in ":,{[}]":
+                self._prev = ch
+            i += 1
+        self._pos = i
+        return entries
+
+    def _fits(self, ch: str) -> bool:
+        """Whether `ch`, outside a string, can follow the previous token of the candidate."""
+        prev = self._prev
+        in_object = self._stack[-1] == "{"
+        value_start = prev == ":" if in_object else prev in "[,"
+        value_end = prev in ('"', "}", "]", LITERAL)
+        if ch in "{[":
+            return value_start
+        if ch == '"':
+            return value_start or (in_object and prev in "{,")
+        if ch == ":":
+            return in_object and prev == '"'
+        if ch == ",":
+            return value_end
+        if ch == "}":
+            return in_object and (prev == "{" or value_end)
+        if ch == "]":
+            return not in_object and (prev == "[" or value_end)
+        if ch in LITERAL_CHARS:
+            return value_start or prev == LITERAL
+        return False
@@ -0,0 +1,75 @@
+import math
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from .timestamps import format_timestamp, parse_timestamp
+
+
+EVENT_KINDS = ("mistake", "missed_opportunity", "repeated_error")
+
+
+@dataclass(frozen=True)
+class TimelineEvent:
+    """One timestamped entry of an analysis. A repeated error gives one event per occurrence."""
+    __slots__ = ("seconds", "kind", "index", "entry")
+    seconds: int
+    kind: str
+    index: int  # position of the entry in its section of the analysis
+    entry: Dict
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "seconds": self.seconds,
+            "timestamp": format_timestamp(self.seconds),
+            "index": self.index,
+            "entry": self.entry,
+        }
+
+
+class AnalysisTimeline:
+    """The timestamped entries of one analysis, sorted by time.
+
+    Timestamps are parsed once when the timeline is built; `between` finds
+    a time window with two binary searches. Entries without a readable
+    timestamp are left out.
+    """
+    __slots__ = ("events", "_seconds")
+
+    def __init__(self, events: Iterable[TimelineEvent]):
+        self.events = sorted(events, key=lambda event: (event.seconds, EVENT_KINDS.index(event.kind), event.index))
+        self._seconds = [event.seconds for event in self.events]
+
+    @classmethod
+    def from_analysis(cls, analysis: Dict) -> "AnalysisTimeline":
+        events = []
+
+        def add(kind, index, entry, timestamp):
+            try:
+                events.append(TimelineEvent(parse_timestamp(timestamp), kind, index, entry))
+            except (AttributeError, ValueError):
+                pass
+
+        sections = (("mistake", "mistakes"), ("missed_opportunity", "missed_opportunities"))
+        for kind, section in sections:
+            for i, entry in enumerate(analysis.get(section) or []):
+                if isinstance(entry, dict):
+                    add(kind, i, entry, entry.get("timestamp"))
+        for i, entry in enumerate(analysis.get("repeated_errors") or []):
+            if isinstance(entry, dict):
+                for occurrence in entry.get("occurrences") or []:
+                    add("repeated_error", i, entry, occurrence)
+        return cls(events)
+
+    def between(self, start: float = 0, end: float = math.inf,
+                kinds: Optional[Iterable[str]] = None) -> List[TimelineEvent]:
+        """Events from `start` to `end` seconds (both inclusive), optionally only of the given kinds."""
+        events = self.events[bisect_left(self._seconds, start):bisect_right(self._seconds, end)]
+        if kinds is not None:
+            kinds = set(kinds)
+            events = [event for event in events if event.kind in kinds]
+        return events
+
+    def __len__(self) -> int:
+        return len(self.events)
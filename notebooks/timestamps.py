@@ -0,0 +1,11 @@
+def parse_timestamp(timestamp: str) -> int:
+    """Seconds for an "HH:MM:SS" or "MM:SS" timestamp."""
+    seconds = 0
+    for part in timestamp.strip().split(":"):
+        seconds = seconds * 60 + int(float(part))
+    return seconds
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = max(0, int(round(seconds)))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
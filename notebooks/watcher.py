@@ -0,0 +1,231 @@
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .backend import AnalysisService, VideoManager, process_videos
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class Inotify:
+    """Minimal inotify binding through ctypes, watching a single directory.
+
+    Raises OSError when inotify is not available (non-Linux systems, or the
+    per-user watch limit is reached).
+    """
+
+    def __init__(self, directory: str):
+        name = ctypes.util.find_library("c")
+        try:
+            libc = ctypes.CDLL(name or "libc.so.6", use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify is not available: {e}")
+        self.fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if add_watch(self.fd, os.fsencode(directory), WATCH_MASK | IN_ONLYDIR) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def read(self, timeout: float) -> List[Tuple[str, int]]:
+        """(file name, mask) for the events that arrive within `timeout` seconds."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((os.fsdecode(name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """Reports video files in a drop folder once they have finished being written.
+
+    With inotify, the folder is only listed at startup, after an event
+    queue overflow, and every `rescan_interval` seconds as a safety net.
+    Between rescans only files named in events are stat'ed. Without
+    inotify, the folder is listed with os.scandir only when its mtime
+    changes (a file was added, removed or renamed), plus the periodic
+    rescan.
+
+    A file is ready once its size and mtime have not changed for
+    `settle_seconds`. Ready files that were handed to `mark_done` are
+    remembered by size and mtime in `state_path`, so after a restart only
+    new or changed files are reported again.
+    """
+
+    def __init__(self, directory: str, extensions: Iterable[str], state_path: str,
+                 settle_seconds: float = 5.0, rescan_interval: float = 300.0, use_inotify: bool = True):
+        self.directory = directory
+        self.extensions = {extension.lower() for extension in extensions}
+        self.state_path = state_path
+        self.settle_seconds = settle_seconds
+        self.rescan_interval = rescan_interval
+        self.done: Dict[str, List[int]] = self._load_state()  # name -> [size, mtime_ns]
+        self._pending: Dict[str, Tuple[int, int, float]] = {}  # name -> (size, mtime_ns, last change)
+        self._dir_mtime = None
+        self._next_rescan = 0.0
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify(directory)
+            except OSError as e:
+                logging.info(f"Watching {directory} by polling: {e}")
+
+    def _load_state(self) -> Dict[str, List[int]]:
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.done, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _wanted(self, name: str) -> bool:
+        return not name.startswith(".") and os.path.splitext(name)[1].lower() in self.extensions
+
+    def _stat(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _touch(self, name: str, now: float, signature: Optional[Tuple[int, int]] = None):
+        """Note a possible change to `name`; it becomes ready after settling."""
+        signature = signature or self._stat(name)
+        if signature is None:
+            self._pending.pop(name, None)
+        elif list(signature) != self.done.get(name):
+            previous = self._pending.get(name)
+            if previous is None or previous[:2] != signature:
+                self._pending[name] = (*signature, now)
+
+    def _rescan(self, now: float):
+        seen = set()
+        self._dir_mtime = os.stat(self.directory).st_mtime_ns
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and self._wanted(entry.name):
+                    seen.add(entry.name)
+                    stat = entry.stat()
+                    self._touch(entry.name, now, (stat.st_size, stat.st_mtime_ns))
+        removed = [name for name in self.done if name not in seen]
+        for name in removed:
+            del self.done[name]
+        if removed:
+            self._save_state()
+        self._next_rescan = now + self.rescan_interval
+
+    def poll(self, timeout: float = 1.0) -> List[str]:
+        """Wait up to `timeout` seconds and return paths of files that became ready."""
+        now = time.monotonic()
+        if now >= self._next_rescan:
+            self._rescan(now)
+        elif self.inotify is not None:
+            for name, mask in self.inotify.read(timeout):
+                if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                    self._next_rescan = 0.0
+                elif self._wanted(name):
+                    self._touch(name, time.monotonic())
+        else:
+            time.sleep(timeout)
+            if os.stat(self.directory).st_mtime_ns != self._dir_mtime:
+                self._rescan(time.monotonic())
+
+        now = time.monotonic()
+        ready = []
+        for name, (size, mtime_ns, changed) in list(self._pending.items()):
+            signature = self._stat(name)
+            if signature is None:
+                del self._pending[name]
+            elif signature != (size, mtime_ns):
+                self._pending[name] = (*signature, now)  # still being written
+            elif now - changed >= self.settle_seconds:
+                del self._pending[name]
+                ready.append(os.path.join(self.directory, name))
+        return ready
+
+    def mark_done(self, paths: Iterable[str]):
+        """Remember `paths` as handled, so they are not reported again unless they change."""
+        for path in paths:
+            name = os.path.basename(path)
+            signature = self._stat(name)
+            if signature is not None:
+                self.done[name] = list(signature)
+        self._save_state()
+
+    def run(self, on_ready: Callable[[List[str]], None], stop: Optional[threading.Event] = None,
+            poll_timeout: float = 1.0):
+        """Call `on_ready(paths)` for each batch of ready files until `stop` is set."""
+        try:
+            while stop is None or not stop.is_set():
+                paths = self.poll(poll_timeout)
+                if paths:
+                    on_ready(paths)
+                    self.mark_done(paths)
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+
+
+def watch_videos(video_manager: VideoManager, analysis_service: AnalysisService, game_name: str,
+                 stop: Optional[threading.Event] = None, **process_options):
+    """Analyze videos as they are dropped into VIDEO_DIR, until `stop` is set.
+
+    Each batch of finished files goes through process_videos (with the same
+    keyword options, e.g. cache or segmenter) without rescanning the folder.
+    Files that were analyzed while watching and then rewritten are analyzed
+    again; files analyzed before the watcher first saw them are skipped.
+    """
+    config = video_manager.config
+    watcher = DirectoryWatcher(config.VIDEO_DIR, config.VIDEO_EXTENSIONS, config.WATCH_STATE_FILE,
+                               settle_seconds=config.WATCH_SETTLE_SECONDS,
+                               rescan_interval=config.WATCH_RESCAN_INTERVAL)
+    logging.info(f"Watching {config.VIDEO_DIR} for new videos"
+                 f" ({'inotify' if watcher.inotify is not None else 'polling'})")
+
+    def analyze(paths):
+        # Reported again after being marked done, so rewritten since
+        changed = [path for path in paths if os.path.basename(path) in watcher.done]
+        logging.info(f"{len(paths) - len(changed)} new and {len(changed)} changed videos: "
+                     f"{', '.join(map(os.path.basename, paths))}")
+        process_videos(video_manager, analysis_service, game_name, paths=paths, changed=changed, **process_options)
+
+    watcher.run(analyze, stop)
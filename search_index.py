@@ -0,0 +1,224 @@
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from jobs import JobStatus
+from notebooks.timestamps import parse_timestamp
+
+TOKEN_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# Text fields indexed for each analysis section, with the section's kind
+INDEXED_FIELDS = (
+    ('mistake', 'mistakes', ('description', 'why_incorrect', 'better_alternative', 'expected_benefit')),
+    ('missed_opportunity', 'missed_opportunities', ('missed_action', 'expected_outcome')),
+    ('repeated_error', 'repeated_errors', ('pattern', 'fix')),
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def parse_query(query: str) -> List[Tuple[str, ...]]:
+    """Quoted phrases and single words of `query`, each as a tuple of terms."""
+    parts = []
+    for phrase, word in QUERY_RE.findall(query):
+        terms = tuple(tokenize(phrase if phrase else word))
+        if terms and terms not in parts:
+            parts.append(terms)
+    return parts
+
+
+def _milliseconds(timestamps: Iterable) -> List[int]:
+    result = []
+    for timestamp in timestamps:
+        try:
+            result.append(parse_timestamp(timestamp) * 1000)
+        except (AttributeError, ValueError):
+            pass
+    return sorted(set(result))
+
+
+class Document:
+    __slots__ = ('filename', 'user_id', 'length', 'terms', 'starts', 'segments')
+
+    def __init__(self, filename: str, user_id: Optional[str]):
+        self.filename = filename
+        self.user_id = user_id
+        self.length = 0
+        self.terms = set()
+        self.starts: List[int] = []  # first position of each segment
+        self.segments: List[Tuple[str, int, str, List[int]]] = []  # (kind, index, field, timestamps in ms)
+
+    def segment_at(self, position: int) -> Tuple[str, int, str, List[int]]:
+        return self.segments[bisect_right(self.starts, position) - 1]
+
+
+class SearchIndex:
+    """Full-text index over the text of completed analyses.
+
+    Every indexed field of every entry (see INDEXED_FIELDS) is a segment of
+    its video's document. Postings keep the positions of each term, so
+    quoted phrases are matched exactly and never across two fields. Results
+    are ranked with BM25 and every query part must match. Each hit is mapped
+    back to its entry, whose timestamps (or a repeated error's occurrences)
+    are returned in milliseconds.
+
+    The index lives in memory: `rebuild` fills it from stored records and
+    `update`, a store listener, re-indexes a video whenever its analysis
+    is completed and drops it when it leaves the completed state.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, List[int]]] = {}  # term -> doc id -> positions
+        self._docs: Dict[int, Document] = {}
+        self._doc_ids: Dict[str, int] = {}  # filename -> doc id
+        self._next_id = 0
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._docs)
+
+    def update(self, old_status: Optional[str], record: Dict):
+        if record['status'] == JobStatus.COMPLETED and record['analysis']:
+            self.add(record['filename'], record['user_id'], record['analysis'])
+        elif record['filename'] in self._doc_ids:
+            self.remove(record['filename'])
+
+    def rebuild(self, records: Iterable[Dict]) -> int:
+        """Replace the index with the completed `records`. Returns the number indexed."""
+        start = time.perf_counter()
+        with self._lock:
+            self._postings, self._docs, self._doc_ids = {}, {}, {}
+            self._total_length = 0
+            for record in records:
+                if record['status'] == JobStatus.COMPLETED and record['analysis']:
+                    self.add(record['filename'], record['user_id'], record['analysis'])
+            count = len(self._docs)
+        logging.info(f"Indexed {count} analyses for search in {time.perf_counter() - start:.2f}s")
+        return count
+
+    def add(self, filename: str, user_id: Optional[str], analysis: Dict):
+        """Index (or re-index) the analysis of `filename`."""
+        doc = Document(filename, user_id)
+        term_positions: Dict[str, List[int]] = {}
+        position = 0
+        for kind, section, fields in INDEXED_FIELDS:
+            for index, entry in enumerate(analysis.get(section) or []):
+                if not isinstance(entry, dict):
+                    continue
+                timestamps = entry.get('occurrences') if kind == 'repeated_error' else [entry.get('timestamp')]
+                milliseconds = _milliseconds(timestamps or [])
+                for field in fields:
+                    tokens = tokenize(entry.get(field) or '')
+                    if not tokens:
+                        continue
+                    doc.starts.append(position)
+                    doc.segments.append((kind, index, field, milliseconds))
+                    for token in tokens:
+                        term_positions.setdefault(token, []).append(position)
+                        position += 1
+                    position += 1  # an unused position, so phrases never span two fields
+        doc.length = position - len(doc.segments)
+        doc.terms = set(term_positions)
+
+        with self._lock:
+            self.remove(filename)
+            doc_id = self._next_id
+            self._next_id += 1
+            self._docs[doc_id] = doc
+            self._doc_ids[filename] = doc_id
+            self._total_length += doc.length
+            for term, positions in term_positions.items():
+                self._postings.setdefault(term, {})[doc_id] = positions
+
+    def remove(self, filename: str):
+        with self._lock:
+            doc_id = self._doc_ids.pop(filename, None)
+            if doc_id is None:
+                return
+            doc = self._docs.pop(doc_id)
+            self._total_length -= doc.length
+            for term in doc.terms:
+                postings = self._postings[term]
+                del postings[doc_id]
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, user_id: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """The best `limit` videos matching every word and quoted phrase of `query`, best first.
+
+        Only `user_id`'s videos are returned when it is given.
+        """
+        parts = parse_query(query)
+        if not parts:
+            return []
+        with self._lock:
+            matches = [self._match(terms) for terms in parts]  # per part: doc id -> match start positions
+            if not all(matches):
+                return []
+            candidates = set.intersection(*(set(match) for match in matches))
+            if user_id is not None:
+                candidates = {doc_id for doc_id in candidates if self._docs[doc_id].user_id == user_id}
+            doc_count = len(self._docs)
+            average_length = self._total_length / doc_count if doc_count else 0.0
+            idfs = [math.log(1 + (doc_count - len(match) + 0.5) / (len(match) + 0.5)) for match in matches]
+
+            def score(doc_id):
+                norm = self.k1 * (1 - self.b + self.b * self._docs[doc_id].length / (average_length or 1))
+                total = 0.0
+                for idf, match in zip(idfs, matches):
+                    frequency = len(match[doc_id])
+                    total += idf * frequency * (self.k1 + 1) / (frequency + norm)
+                return total
+
+            scored = heapq.nlargest(limit, ((score(doc_id), doc_id) for doc_id in candidates),
+                                    key=lambda item: (item[0], -item[1]))
+            return [self._result(doc_id, value, [match[doc_id] for match in matches]) for value, doc_id in scored]
+
+    def _match(self, terms: Tuple[str, ...]) -> Dict[int, List[int]]:
+        # Called with the lock held
+        postings = [self._postings.get(term) for term in terms]
+        if not all(postings):
+            return {}
+        if len(terms) == 1:
+            return postings[0]
+        rarest = min(range(len(terms)), key=lambda i: len(postings[i]))
+        matches = {}
+        for doc_id in postings[rarest]:
+            if not all(doc_id in term_postings for term_postings in postings):
+                continue
+            following = [set(term_postings[doc_id]) for term_postings in postings[1:]]
+            starts = [start for start in postings[0][doc_id]
+                      if all(start + offset in positions for offset, positions in enumerate(following, 1))]
+            if starts:
+                matches[doc_id] = starts
+        return matches
+
+    def _result(self, doc_id: int, score: float, starts: List[List[int]]) -> Dict:
+        doc = self._docs[doc_id]
+        hits = {}
+        for positions in starts:
+            for position in positions:
+                kind, index, field, milliseconds = doc.segment_at(position)
+                hit = hits.setdefault((kind, index), {'kind': kind, 'index': index, 'fields': [],
+                                                      'timestamps_ms': milliseconds})
+                if field not in hit['fields']:
+                    hit['fields'].append(field)
+        hits = sorted(hits.values(), key=lambda hit: (hit['timestamps_ms'][:1] or [math.inf], hit['kind']))
+        return {
+            'filename': doc.filename,
+            'score': round(score, 4),
+            'timestamps_ms': sorted({ms for hit in hits for ms in hit['timestamps_ms']}),
+            'hits': hits,
+        }
@@ -0,0 +1,482 @@
+import argparse
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from jobs import JobStatus
+
+RECORD_FIELDS = ('user_id', 'analysis', 'error')
+
+
+class InvalidTransitionError(ValueError):
+    """Raised when a status update is not allowed by JobStatus.TRANSITIONS."""
+
+
+class OwnershipError(ValueError):
+    """Raised when a video's record would be taken over by a different user."""
+
+
+def record_from_entry(filename: str, entry: Dict) -> Dict:
+    """Normalise an entry from processed_videos.json into a store record.
+
+    The notebook backend writes the analysis itself as the entry, while the
+    Flask app writes {"status": ..., "analysis": ...}.
+    """
+    if 'status' not in entry:
+        entry = {'status': JobStatus.COMPLETED, 'analysis': entry}
+    return {
+        'filename': filename,
+        'user_id': entry.get('user_id'),
+        'status': entry['status'],
+        'analysis': entry.get('analysis'),
+        'error': entry.get('error'),
+        'updated_at': entry.get('updated_at', 0),
+    }
+
+
+def analysis_summary(analysis: Optional[Dict]) -> Dict:
+    """Game and mistake count of an analysis (None while there is no analysis)."""
+    analysis = analysis or {}
+    return {
+        'game': analysis.get('game'),
+        'mistake_count': len(analysis['mistakes']) if 'mistakes' in analysis else None,
+    }
+
+
+def summarize(record: Dict) -> Dict:
+    """The lightweight view of a record used for listings."""
+    return {
+        'filename': record['filename'],
+        'status': record['status'],
+        **analysis_summary(record.get('analysis')),
+        'updated_at': record['updated_at'],
+    }
+
+
+def encode_cursor(updated_at: float, filename: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([updated_at, filename]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Inverse of encode_cursor. Raises ValueError for a cursor this store did not produce."""
+    try:
+        updated_at, filename = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(updated_at), str(filename)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _check_transition(filename: str, old_status: Optional[str], status: str):
+    if not JobStatus.can_transition(old_status, status):
+        raise InvalidTransitionError(f"Invalid status change for {filename}: {old_status} -> {status}")
+
+
+def _check_owner(filename: str, owner: Optional[str], fields: Dict):
+    # Records are keyed by filename, so a new upload must not replace another user's video
+    if 'user_id' in fields and owner is not None and fields['user_id'] != owner:
+        raise OwnershipError(f"{filename} belongs to another user")
+
+
+def _check_fields(fields: Dict):
+    unknown = set(fields) - set(RECORD_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown record fields: {', '.join(sorted(unknown))}")
+
+
+class AnalysisStore:
+    """Storage for per-video status and analysis records.
+
+    Records are dicts with filename, user_id, status, analysis, error and
+    updated_at keys. Listeners added with `add_listener` are called as
+    `listener(old_status, record)` after every committed status change.
+    """
+
+    def __init__(self):
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, old_status: Optional[str], record: Dict):
+        for listener in self._listeners:
+            try:
+                listener(old_status, record)
+            except Exception as e:
+                logging.error(f"Status listener failed for {record['filename']}: {e}")
+
+    def get(self, filename: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def list(self, user_id: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def list_summaries(self, user_id: Optional[str], status: Optional[str] = None, game: Optional[str] = None,
+                       cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+        """One page of `summarize`d records, newest first.
+
+        Returns (summaries, next_cursor); next_cursor is None on the last page.
+        Pass it back as `cursor` to get the following page.
+        """
+        raise NotImplementedError
+
+    def version(self, user_id: Optional[str]) -> str:
+        """Token that changes whenever any of `user_id`'s records change."""
+        raise NotImplementedError
+
+    def update_status(self, filename: str, status: str, **fields) -> Dict:
+        """Move `filename` to `status`, updating only that video's record.
+
+        Moving to pending starts a fresh record; other moves keep existing fields.
+        """
+        raise NotImplementedError
+
+    def put_many(self, records: List[Dict]):
+        raise NotImplementedError
+
+    def restore(self, record: Dict, old_status: Optional[str] = JobStatus.PENDING):
+        """Put back a record read earlier with `get`, e.g. after a replacement upload failed.
+
+        Unlike put_many, listeners are told, so derived state follows.
+        """
+        self.put_many([record])
+        self._notify(old_status, record)
+
+    def delete(self, filename: str):
+        raise NotImplementedError
+
+    def is_empty(self) -> bool:
+        raise NotImplementedError
+
+
+class JSONAnalysisStore(AnalysisStore):
+    """The original single-file store. Every write rewrites the whole file."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            logging.info(f"No analysis file found at {self.path}")
+            return {}
+
+    def _save(self, data: Dict):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def get(self, filename: str) -> Optional[Dict]:
+        entry = self._load().get(filename)
+        return record_from_entry(filename, entry) if entry is not None else None
+
+    def list(self, user_id: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        records = [record_from_entry(filename, entry) for filename, entry in self._load().items()]
+        return [
+            record for record in records
+            if (user_id is None or record['user_id'] == user_id)
+            and (status is None or record['status'] == status)
+        ]
+
+    def list_summaries(self, user_id: Optional[str], status: Optional[str] = None, game: Optional[str] = None,
+                       cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+        after = decode_cursor(cursor) if cursor else None
+        summaries = [
+            summary for summary in map(summarize, self.list(user_id, status))
+            if (game is None or (summary['game'] or '').lower() == game.lower())
+            and (after is None or (summary['updated_at'], summary['filename']) < after)
+        ]
+        summaries.sort(key=lambda summary: (summary['updated_at'], summary['filename']), reverse=True)
+        page = summaries[:limit]
+        more = len(summaries) > limit
+        return page, encode_cursor(page[-1]['updated_at'], page[-1]['filename']) if more else None
+
+    def version(self, user_id: Optional[str]) -> str:
+        # Every write replaces the file, so its inode and mtime identify the contents
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return '0'
+        return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def update_status(self, filename: str, status: str, **fields) -> Dict:
+        _check_fields(fields)
+        with self._lock:
+            data = self._load()
+            entry = data.get(filename)
+            current = record_from_entry(filename, entry) if entry is not None else None
+            _check_owner(filename, current and current['user_id'], fields)
+            _check_transition(filename, current and current['status'], status)
+            record = {'status': status, **fields, 'updated_at': time.time()}
+            if current is not None and status != JobStatus.PENDING:
+                record = {**{k: current[k] for k in RECORD_FIELDS}, **record}
+            data[filename] = record
+            self._save(data)
+        record = record_from_entry(filename, record)
+        self._notify(current and current['status'], record)
+        return record
+
+    def put_many(self, records: List[Dict]):
+        with self._lock:
+            data = self._load()
+            for record in records:
+                data[record['filename']] = {k: v for k, v in record.items() if k != 'filename'}
+            self._save(data)
+
+    def delete(self, filename: str):
+        with self._lock:
+            data = self._load()
+            if data.pop(filename, None) is not None:
+                self._save(data)
+
+    def is_empty(self) -> bool:
+        return not self._load()
+
+
+class SQLiteAnalysisStore(AnalysisStore):
+    """One row per video in a WAL-mode SQLite database.
+
+    Each thread gets its own connection; readers never block the writer.
+    The game and mistake count of each analysis are kept in their own
+    columns so listings never parse analysis JSON, and a per-user version
+    counter is bumped in the same transaction as every write.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS videos (
+            filename TEXT PRIMARY KEY,
+            user_id TEXT,
+            status TEXT NOT NULL,
+            analysis TEXT,
+            error TEXT,
+            updated_at REAL NOT NULL,
+            game TEXT,
+            mistake_count INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        DROP INDEX IF EXISTS idx_videos_user;
+        CREATE INDEX IF NOT EXISTS idx_videos_user_page ON videos (user_id, updated_at DESC, filename DESC);
+        CREATE INDEX IF NOT EXISTS idx_videos_status ON videos (status);
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        self._add_summary_columns(conn)
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _add_summary_columns(conn: sqlite3.Connection):
+        """Upgrade databases created before the summary columns existed."""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(videos)')}
+        if not columns or 'game' in columns:
+            return
+        conn.executescript("""
+            ALTER TABLE videos ADD COLUMN game TEXT;
+            ALTER TABLE videos ADD COLUMN mistake_count INTEGER;
+            UPDATE videos SET game = json_extract(analysis, '$.game'),
+                              mistake_count = json_array_length(analysis, '$.mistakes')
+            WHERE analysis IS NOT NULL;
+        """)
+
+    @staticmethod
+    def _bump_versions(conn: sqlite3.Connection, user_ids):
+        conn.executemany(
+            'INSERT INTO user_versions (user_id, version) VALUES (?, 1) '
+            'ON CONFLICT (user_id) DO UPDATE SET version = version + 1',
+            [(user_id or '',) for user_id in set(user_ids)],
+        )
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> Dict:
+        record = {field: row[field] for field in ('filename', 'user_id', 'status', 'analysis', 'error', 'updated_at')}
+        if record['analysis'] is not None:
+            record['analysis'] = json.loads(record['analysis'])
+        return record
+
+    def get(self, filename: str) -> Optional[Dict]:
+        row = self._conn().execute('SELECT * FROM videos WHERE filename = ?', (filename,)).fetchone()
+        return self._to_record(row) if row is not None else None
+
+    def list(self, user_id: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        query, params = 'SELECT * FROM videos', []
+        clauses = []
+        if user_id is not None:
+            clauses.append('user_id = ?')
+            params.append(user_id)
+        if status is not None:
+            clauses.append('status = ?')
+            params.append(status)
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY updated_at DESC'
+        return [self._to_record(row) for row in self._conn().execute(query, params)]
+
+    def list_summaries(self, user_id: Optional[str], status: Optional[str] = None, game: Optional[str] = None,
+                       cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+        clauses, params = ['user_id IS ?'], [user_id]
+        if status is not None:
+            clauses.append('status = ?')
+            params.append(status)
+        if game is not None:
+            clauses.append('game = ? COLLATE NOCASE')
+            params.append(game)
+        if cursor:
+            clauses.append('(updated_at, filename) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        rows = self._conn().execute(
+            'SELECT filename, status, game, mistake_count, updated_at FROM videos '
+            f'WHERE {" AND ".join(clauses)} ORDER BY updated_at DESC, filename DESC LIMIT ?',
+            (*params, limit + 1),
+        ).fetchall()
+        page = [dict(row) for row in rows[:limit]]
+        more = len(rows) > limit
+        return page, encode_cursor(page[-1]['updated_at'], page[-1]['filename']) if more else None
+
+    def version(self, user_id: Optional[str]) -> str:
+        row = self._conn().execute(
+            'SELECT version FROM user_versions WHERE user_id = ?', (user_id or '',)
+        ).fetchone()
+        return str(row['version'] if row is not None else 0)
+
+    def update_status(self, filename: str, status: str, **fields) -> Dict:
+        _check_fields(fields)
+        if 'analysis' in fields:
+            fields.update(analysis_summary(fields['analysis']))
+            if fields['analysis'] is not None:
+                fields['analysis'] = json.dumps(fields['analysis'])
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT status, user_id FROM videos WHERE filename = ?', (filename,)).fetchone()
+            _check_owner(filename, row and row['user_id'], fields)
+            _check_transition(filename, row and row['status'], status)
+            now = time.time()
+            if row is None or status == JobStatus.PENDING:
+                values = {field: fields.get(field) for field in (*RECORD_FIELDS, 'game', 'mistake_count')}
+                conn.execute(
+                    'INSERT OR REPLACE INTO videos '
+                    '(filename, user_id, status, analysis, error, updated_at, game, mistake_count) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (filename, values['user_id'], status, values['analysis'], values['error'], now,
+                     values['game'], values['mistake_count']),
+                )
+                user_ids = [values['user_id']]
+            else:
+                assignments = ''.join(f', {field} = ?' for field in fields)
+                conn.execute(
+                    f'UPDATE videos SET status = ?, updated_at = ?{assignments} WHERE filename = ?',
+                    (status, now, *fields.values(), filename),
+                )
+                user_ids = [fields.get('user_id', row['user_id'])]
+            if row is not None:
+                user_ids.append(row['user_id'])
+            self._bump_versions(conn, user_ids)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        record = self.get(filename)
+        self._notify(row and row['status'], record)
+        return record
+
+    def put_many(self, records: List[Dict]):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO videos '
+                '(filename, user_id, status, analysis, error, updated_at, game, mistake_count) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        record['filename'], record.get('user_id'), record['status'],
+                        json.dumps(record['analysis']) if record.get('analysis') is not None else None,
+                        record.get('error'), record.get('updated_at') or time.time(),
+                        *analysis_summary(record.get('analysis')).values(),
+                    )
+                    for record in records
+                ],
+            )
+            self._bump_versions(conn, [record.get('user_id') for record in records])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, filename: str):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT user_id FROM videos WHERE filename = ?', (filename,)).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM videos WHERE filename = ?', (filename,))
+                self._bump_versions(conn, [row['user_id']])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def is_empty(self) -> bool:
+        return self._conn().execute('SELECT 1 FROM videos LIMIT 1').fetchone() is None
+
+
+def create_store(backend: str, path: str) -> AnalysisStore:
+    if backend == 'sqlite':
+        return SQLiteAnalysisStore(path)
+    if backend == 'json':
+        return JSONAnalysisStore(path)
+    raise ValueError(f"Unknown store backend: {backend}")
+
+
+def migrate_json(json_path: str, store: AnalysisStore, user_id: Optional[str] = None) -> int:
+    """Copy every entry of a processed_videos.json file into `store`.
+
+    Entries without an owner are assigned to `user_id`. Returns the number of
+    records written.
+    """
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    records = []
+    for filename, entry in data.items():
+        record = record_from_entry(filename, entry)
+        if record['user_id'] is None:
+            record['user_id'] = user_id
+        records.append(record)
+    store.put_many(records)
+    logging.info(f"Migrated {len(records)} videos from {json_path}")
+    return len(records)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate processed_videos.json into a SQLite analysis store.')
+    parser.add_argument('json_file')
+    parser.add_argument('database')
+    parser.add_argument('--user-id', help='Owner for entries that have none')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    migrate_json(args.json_file, SQLiteAnalysisStore(args.database), args.user_id)
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_genai import FakeGenAI, FakeProfile, Latency, fake_analysis
+from notebooks.backend import AnalysisService, Config, VideoManager
+from notebooks.batch import LocalBatchBackend, process_videos_batch
+
+
+class DroppingBackend(LocalBatchBackend):
+    """Rewrites the results of a finished job: drops the line for "lost.mp4"
+    and strips the candidates from the one for "truncated.mp4"."""
+
+    def download(self, job_id, results_path):
+        super().download(job_id, results_path)
+        with open(results_path, "r") as f:
+            results = [json.loads(line) for line in f]
+        with open(results_path, "w") as f:
+            for result in results:
+                if result["key"] == "lost.mp4":
+                    continue
+                if result["key"] == "truncated.mp4":
+                    result["response"] = {"candidates": []}
+                f.write(json.dumps(result) + "\n")
+
+
+def test_batch_results_are_stored_or_reported(tmp_path):
+    video_dir = tmp_path / "videos"
+    video_dir.mkdir()
+    for name in ("good.mp4", "error.mp4", "garbled.mp4", "truncated.mp4", "lost.mp4"):
+        (video_dir / name).write_bytes(name.encode())
+    config = Config(VIDEO_DIR=str(video_dir), PROCESSED_VIDEOS_LOG=str(tmp_path / "processed_videos.json"),
+                    POLL_INITIAL_INTERVAL=0.01, WAIT_INTERVAL=0.05, BATCH_POLL_INTERVAL=0.01)
+    fake = FakeGenAI(FakeProfile(upload=Latency(), activation=Latency(), get_file=Latency(), generate=Latency()))
+    video_manager = VideoManager(config, client=fake)
+    analysis_service = AnalysisService(client=fake)
+    analysis = fake_analysis("EA FC 24", 2)
+
+    def respond(request):
+        uri = request["contents"][0]["parts"][1]["file_data"]["file_uri"]
+        name = {video_file.uri: video_file.display_name for video_file in fake.list_files()}[uri]
+        if name == "error.mp4":
+            raise RuntimeError("quota exceeded")
+        if name == "garbled.mp4":
+            return "Sorry, I could not watch this video."
+        return json.dumps(analysis)
+
+    backend = DroppingBackend(respond)
+    result = process_videos_batch(video_manager, analysis_service, "EA FC 24", backend, str(tmp_path / "batch"))
+
+    assert result["completed"] == 1
+    assert sorted(result["failed"]) == ["error.mp4", "garbled.mp4", "lost.mp4", "truncated.mp4"]
+    assert result["failed"]["error.mp4"] == "quota exceeded"
+    assert result["failed"]["truncated.mp4"].startswith("Malformed response")
+    assert result["failed"]["lost.mp4"] == "missing from the batch results"
+    assert video_manager.processed_videos["good.mp4"]["game"] == "EA FC 24"
+    assert list(video_manager.processed_videos) == ["good.mp4"]
+    # Stored on disk, not only in memory
+    assert list(VideoManager(config).processed_videos) == ["good.mp4"]
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import EventBroadcaster
+
+
+def test_last_id_from_before_a_restart_gets_a_resync():
+    broadcaster = EventBroadcaster()
+    listener = broadcaster.listen(500, heartbeat=0.01)
+    for number in range(3):
+        broadcaster.publish({'number': number})
+
+    assert next(listener) == (3, {'type': 'resync'})
+    broadcaster.publish({'number': 3})
+    assert next(listener) == (4, {'number': 3})
+
+
+def test_listener_that_fell_behind_gets_a_resync():
+    broadcaster = EventBroadcaster(history=2)
+    listener = broadcaster.listen(0, heartbeat=0.01)
+    for number in range(4):
+        broadcaster.publish({'number': number})
+
+    assert [next(listener) for _ in range(3)] == [
+        (2, {'type': 'resync'}), (3, {'number': 2}), (4, {'number': 3}),
+    ]
@@ -0,0 +1,38 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notebooks.streaming import IncrementalAnalysisParser
+
+ANALYSIS = {
+    'game': 'EA FC 24',
+    'key_focus_areas': ['Positioning'],
+    'mistakes': [{'timestamp': '00:01:10', 'description': 'Lost the ball {again}'}],
+    'repeated_errors': [],
+    'missed_opportunities': [{'timestamp': '00:02:45', 'missed_action': 'Shoot'}],
+}
+
+
+def stream(text, chunk_size=7):
+    parser = IncrementalAnalysisParser()
+    entries = []
+    for start in range(0, len(text), chunk_size):
+        entries += parser.feed(text[start:start + chunk_size])
+    return parser, entries
+
+
+def test_unbalanced_brace_in_prose_before_the_json():
+    parser, entries = stream('Note: { not json here. ' + json.dumps(ANALYSIS))
+
+    assert entries == [('mistakes', ANALYSIS['mistakes'][0]),
+                       ('missed_opportunities', ANALYSIS['missed_opportunities'][0])]
+    assert parser.result == ANALYSIS
+
+
+def test_quotes_in_prose_before_the_json():
+    parser, entries = stream('Here is the "analysis" { you asked for, "as JSON": ' + json.dumps(ANALYSIS))
+
+    assert [section for section, _ in entries] == ['mistakes', 'missed_opportunities']
+    assert parser.result == ANALYSIS
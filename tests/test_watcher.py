@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_genai import FakeGenAI, FakeProfile, Latency
+from notebooks.backend import AnalysisService, Config, VideoManager
+from notebooks.resilience import InferencePolicy
+from notebooks.watcher import watch_videos
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def done(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def test_rewritten_video_is_analyzed_again(tmp_path):
+    video_dir = tmp_path / "videos"
+    video_dir.mkdir()
+    config = Config(VIDEO_DIR=str(video_dir), PROCESSED_VIDEOS_LOG=str(tmp_path / "processed_videos.json"),
+                    WATCH_STATE_FILE=str(tmp_path / "watch_state.json"), WATCH_SETTLE_SECONDS=0.1,
+                    POLL_INITIAL_INTERVAL=0.01, WAIT_INTERVAL=0.05)
+    fake = FakeGenAI(FakeProfile(upload=Latency(), activation=Latency(), get_file=Latency(), generate=Latency()))
+    video_manager = VideoManager(config, client=fake)
+    analysis_service = AnalysisService(client=fake, policy=InferencePolicy(initial_backoff=0.01))
+    # Analyzed before the watcher started: not analyzed again
+    (video_dir / "old.mp4").write_bytes(b"old")
+    video_manager.save_analysis("old.mp4", {"game": "EA FC 24"})
+
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_videos, args=(video_manager, analysis_service, "EA FC 24", stop))
+    watcher.start()
+    try:
+        (video_dir / "match.mp4").write_bytes(b"first recording")
+        wait_until(lambda: fake.calls.get("generate_content") == 1)
+        wait_until(lambda: "match.mp4" in done(config.WATCH_STATE_FILE))
+
+        (video_dir / "match.mp4").write_bytes(b"second, longer recording")
+        wait_until(lambda: fake.calls.get("generate_content") == 2)
+    finally:
+        stop.set()
+        watcher.join()
+
+    assert fake.calls["upload_file"] == 2
+    assert video_manager.processed_videos["old.mp4"] == {"game": "EA FC 24"}